@@ -0,0 +1,41 @@
+"""
+Benchmark of the intensity histograms used for the NC/CON threshold.
+Compares np.histogram on float bin edges with one bincount over the native uint16 data rebinned to the same bins,
+and with rebinning alone, the cost of another bin layout once the intensities are counted.
+Run from the repository folder: python -m benchmarks.bench_histogram
+"""
+import timeit
+
+import numpy as np
+
+from gcx_quant.histogram import int_histogram, rebin
+
+
+def bench(shape, repeat=5):
+    """ This function times both histograms on a random uint16 image of the given shape and checks they are equal.
+    Returns (numpy time, bincount time, rebin time) in seconds, best of repeat.
+    """
+    rng = np.random.default_rng(0)
+    im = rng.gamma(2, 800, shape).clip(0, 65535).astype(np.uint16)
+    bits = np.floor(np.log2(np.max(im)))
+    bins = np.linspace(0,2**bits,500)
+
+    y0,_ = np.histogram(im.reshape(-1,1), bins = bins)
+    y1 = rebin(int_histogram(im), bins)
+    assert np.array_equal(y0, y1)
+
+    t_numpy = min(timeit.repeat(lambda: np.histogram(im.reshape(-1,1), bins = bins), number=1, repeat=repeat))
+    t_count = min(timeit.repeat(lambda: rebin(int_histogram(im), bins), number=1, repeat=repeat))
+    counts = int_histogram(im)
+    t_rebin = min(timeit.repeat(lambda: rebin(counts, bins), number=1, repeat=repeat))
+    return t_numpy, t_count, t_rebin
+
+
+if __name__ == '__main__':
+    print('-'*20)
+    print(" {:>12} {:>14} {:>14} {:>8} {:>12}".format("image", "np.histogram", "bincount", "speedup", "rebin only"))
+    for shape in [(512, 512), (1024, 1024), (2048, 2048), (4096, 4096)]:
+        t_numpy, t_count, t_rebin = bench(shape)
+        print(" {:>12} {:>12.1f}ms {:>12.1f}ms {:>7.1f}x {:>10.3f}ms".format(
+            "{}x{}".format(*shape), t_numpy*1000, t_count*1000, t_numpy/t_count, t_rebin*1000))
+    print('-'*20)
@@ -0,0 +1,234 @@
+"""
+Benchmark of the analyses end to end and per stage on synthetic glycocalyx-like stacks (see benchmarks/synthetic.py).
+Each analysis is timed through its run function on the folder of synthetic stacks, as the scripts and the command
+line run it, with only the czi reading functions of the analysis modules replaced by reading the synthetic tif stacks
+('tif' source) or arrays already in memory ('memory' source, the processing alone).
+Results are appended to benchmarks/history.jsonl (ignored by git) with the git commit, and compared with the last run
+of the same parameters, so speed regressions show up across commits.
+Run from the repository folder: python -m benchmarks.bench_pipeline [--xy 512 --z 40 ...]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+from benchmarks.synthetic import make_folder
+from gcx_quant import cache, files as gcx_files, ha_coverage, mean_int, thickness_xz, wga_thickness
+from gcx_quant.profiling import merge_timings, run_timed_alone
+from gcx_quant.reader import _project, read_tif_channel
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+
+
+def read_channel(tif_file, channel_index=0, arrays=None):
+    """ This function returns one channel (Z, Y, X) of a synthetic stack, from arrays when given else from the tif file.
+    """
+    if arrays is not None:
+        return arrays[tif_file][channel_index]
+    return read_tif_channel(tif_file, channel_index)
+
+def read_plane(tif_file, channel_index=0, axis=2, index=None, arrays=None):
+    """ This function returns one plane of one channel of a synthetic stack, like reader.read_czi_plane.
+    """
+    im = read_channel(tif_file, channel_index, arrays)
+    return np.ascontiguousarray(im.take(im.shape[axis]//2 if index is None else index, axis))
+
+def project(tif_file, channel_index=0, method='max', arrays=None):
+    """ This function returns the z-projection of one channel of a synthetic stack, like reader.project_czi.
+    """
+    # Slices are copied like freshly decoded ones, the projection is folded into the first slice.
+    return _project((np.array(im) for im in read_channel(tif_file, channel_index, arrays)), method)
+
+def channel_slices(tif_file, channels=None, arrays=None):
+    """ This function yields the z-slices of the channels of a synthetic stack, like reader.iter_czi_channel_slices.
+    """
+    if channels is None:
+        channels = range(count_channels(tif_file, arrays))
+    for channel_index in channels:
+        for index, im in enumerate(read_channel(tif_file, channel_index, arrays)):
+            yield channel_index, index, im
+
+def count_channels(tif_file, arrays=None):
+    """ This function returns the number of channels of a synthetic stack.
+    """
+    if arrays is not None:
+        return len(arrays[tif_file])
+    import tifffile
+    with tifffile.TiffFile(tif_file) as tif:
+        return tif.series[0].shape[0]
+
+def get_tif_files(folder='.', ext='czi', con=''):
+    """ This function returns the synthetic tif files of folder, in place of the czi files of files.get_files.
+    """
+    return gcx_files.get_files(folder, 'tif', con)
+
+def readers(arrays=None):
+    """ This function returns the replacements of the czi reading functions of every analysis module,
+    {module: {name: function}}. The orthogonal views of wga_thickness are the XZ views of the stacks.
+    """
+    read = partial(read_channel, arrays=arrays)
+    plane = partial(read_plane, arrays=arrays)
+    return {cache: {"project_czi": partial(project, arrays=arrays)},
+            ha_coverage: {"project_czi": partial(project, arrays=arrays), "get_files": get_tif_files},
+            thickness_xz: {"read_czi_channel": read, "read_czi_plane": plane, "get_files": get_tif_files},
+            wga_thickness: {"read_czi_channel": plane, "get_files": get_tif_files},
+            mean_int: {"read_czi_channel": read, "count_czi_channels": partial(count_channels, arrays=arrays),
+                       "iter_czi_channel_slices": partial(channel_slices, arrays=arrays), "get_files": get_tif_files}}
+
+@contextlib.contextmanager
+def synthetic_reading(arrays=None):
+    """ This function replaces the czi reading functions of the analysis modules by the synthetic readers
+    while the run functions are timed, and puts the originals back after.
+    """
+    originals = []
+    try:
+        for module, functions in readers(arrays).items():
+            for name, function in functions.items():
+                originals.append((module, name, getattr(module, name)))
+                setattr(module, name, function)
+        yield
+    finally:
+        for module, name, function in reversed(originals):
+            setattr(module, name, function)
+
+# Run function and parameters of every analysis, as the scripts call them.
+ANALYSES = {"coverage": (ha_coverage.run_coverage, {}),
+            "per-coverage": (ha_coverage.run_per_coverage, {}),
+            "thickness-xz": (thickness_xz.run, {"k": 100, "simga_gauss": 1}),
+            "wga-thickness": (wga_thickness.run, {"k": 50, "simga_gauss": 1}),
+            "mean-int": (mean_int.run, {})}
+
+def run_analysis(analysis, folder, out_dir, arrays=None, n_workers=1, channel_index=0):
+    """ This function runs one analysis through its run function on the synthetic folder, printing nothing.
+    Returns the timings of the images.
+    """
+    run, params = ANALYSES[analysis]
+    timings = []
+    with synthetic_reading(arrays), contextlib.redirect_stdout(io.StringIO()):
+        run(folder, channel_index=channel_index, out_dir=out_dir, n_workers=n_workers, cache_dir=None,
+            timings=timings, **params)
+    return timings
+
+def bench(analysis, folder, out_dir, arrays=None, repeat=3, n_workers=1):
+    """ This function times one analysis end to end, best of repeat runs.
+    A first run, not timed, imports the libraries the analysis loads lazily (matplotlib, scipy, skimage).
+    Returns {"wall": seconds, "stages": {stage: seconds}, "peak_rss_mb"} of the fastest run, the peak memory of the
+    current process over the run, without the worker processes.
+    """
+    run_analysis(analysis, folder, out_dir, arrays, n_workers)
+    best = None
+    for _ in range(repeat):
+        np.random.seed(0)
+        wall = time.perf_counter()
+        timings, run = run_timed_alone(run_analysis, analysis, folder, out_dir, arrays, n_workers)
+        wall = time.perf_counter() - wall
+        if best is None or wall < best["wall"]:
+            for timing in timings:
+                merge_timings(run, timing)
+            best = {"wall": wall, "stages": {name: record["wall"] for name, record in run["stages"].items()},
+                    "peak_rss_mb": run["peak_rss_mb"]}
+    return best
+
+def git_commit():
+    """ This function returns the current git commit of the repository and whether the tree has local changes.
+    """
+    folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=folder, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=folder,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def last_entry(history_file, params):
+    """ This function returns the last entry of the history with the same parameters, None if there is none.
+    """
+    entry = None
+    try:
+        with open(history_file) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["params"] == params:
+                    entry = record
+    except FileNotFoundError:
+        pass
+    return entry
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the analyses on synthetic stacks.")
+    parser.add_argument("--xy", type=int, default=512, help="size of the X and Y axes (default: 512)")
+    parser.add_argument("--z", type=int, default=40, help="number of z-slices (default: 40)")
+    parser.add_argument("--channels", type=int, default=2, help="number of channels (default: 2)")
+    parser.add_argument("--coverage", type=float, default=0.6, help="fraction of the XY positions with the layer (default: 0.6)")
+    parser.add_argument("--bilayer", type=float, default=0.3, help="fraction of bilayer positions (default: 0.3)")
+    parser.add_argument("--noise", type=float, default=50, help="standard deviation of the noise (default: 50)")
+    parser.add_argument("-n", "--images", type=int, default=4, help="number of image samples (default: 4)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each analysis, the fastest is kept (default: 3)")
+    parser.add_argument("--source", choices=["tif", "memory", "both"], default="both",
+                        help="read the stacks from tif files, from memory or both (default: both)")
+    parser.add_argument("--analyses", nargs="+", choices=list(ANALYSES), default=list(ANALYSES),
+                        help="analyses to time (default: all)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes of the run functions (default: 1)")
+    parser.add_argument("--folder", default=None, help="folder of the synthetic tif files (default: a temporary folder)")
+    parser.add_argument("--history", default=HISTORY_FILE, help="history file of the results, '' to not save them")
+    args = parser.parse_args(argv)
+
+    params = {"xy": args.xy, "z": args.z, "channels": args.channels, "coverage": args.coverage, "bilayer": args.bilayer,
+              "noise": args.noise, "images": args.images, "workers": args.workers}
+    sources = ["tif", "memory"] if args.source == "both" else [args.source]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "stacks") if args.folder is None else args.folder
+        out_dir = os.path.join(tmp, "out")
+        os.makedirs(out_dir)
+        print(" Writing synthetic stacks {xy}x{xy}x{z}, {channels} channels, {images} images ...".format(**params))
+        files = make_folder(folder, args.images, args.xy, args.z, args.channels, args.coverage, args.bilayer, args.noise)
+        arrays = None
+        if "memory" in sources:
+            import tifffile
+            arrays = {file: tifffile.imread(file) for group in files.values() for file in group}
+
+        results = {}
+        for analysis in args.analyses:
+            for source in sources:
+                results["{} ({})".format(analysis, source)] = bench(
+                    analysis, folder, out_dir, arrays if source == "memory" else None, args.repeat, args.workers)
+
+    commit, dirty = git_commit()
+    previous = last_entry(args.history, params) if args.history else None
+
+    print('-'*20)
+    print(" {:<26}{:>10}{:>10}{:>10}  {}".format("analysis", "wall (s)", "previous", "change", "slowest stages"))
+    for name, result in results.items():
+        before = previous["results"].get(name) if previous is not None else None
+        stages = sorted(result["stages"].items(), key=lambda item: -item[1])[:3]
+        print(" {:<26}{:>10.3f}{:>10}{:>10}  {}".format(
+            name, result["wall"],
+            "-" if before is None else "{:.3f}".format(before["wall"]),
+            "-" if before is None else "{:+.0f}%".format((result["wall"]/before["wall"] - 1)*100),
+            ", ".join("{} {:.3f}".format(stage_name, wall) for stage_name, wall in stages)))
+    if previous is not None:
+        print(" Previous run: commit {} on {}".format(previous["commit"], previous["date"]))
+    print('-'*20)
+
+    if args.history:
+        entry = {"commit": commit, "dirty": dirty, "date": datetime.datetime.now().isoformat(timespec='seconds'),
+                 "params": params, "results": results}
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        print(" Results are added to {}.".format(args.history))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of the Gaussian blur and otsu threshold of the thickness analyses.
+Compares scipy.ndimage.gaussian_filter + skimage.filters.threshold_otsu on every XZ view with the preprocessing of
+gcx_quant.preprocess: otsu from one bincount, and the views of a stack blurred and thresholded batch at a time.
+Also times the blur of the integer stack against gaussian_filter of the stack promoted to float64, and many small
+orthogonal views blurred and thresholded one at a time against the same views stacked (wga-thickness --batch).
+Run from the repository folder: python -m benchmarks.bench_preprocess
+"""
+import timeit
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from skimage import filters
+
+from benchmarks.synthetic import make_stack
+from gcx_quant.preprocess import blur, otsu, otsu_batch
+
+
+def views_scipy(im, sigma):
+    """ This function blurs and thresholds every XZ view im[:, :, i] one at a time, as the analyses did.
+    """
+    thresholds = []
+    for i in range(im.shape[2]):
+        plane = gaussian_filter(im[:, :, i], sigma)
+        thresholds.append(filters.threshold_otsu(plane))
+    return np.array(thresholds)
+
+def views_batch(im, sigma, batch=64):
+    """ This function blurs and thresholds the XZ views batch at a time.
+    """
+    thresholds = []
+    for start in range(0, im.shape[2], batch):
+        views = np.ascontiguousarray(np.moveaxis(im[:, :, start:start + batch], 2, 0))
+        views = blur(views, sigma, axes=(1, 2))
+        thresholds.append(otsu_batch(views, axis=0))
+    return np.concatenate(thresholds)
+
+def bench(xy, z, repeat=3):
+    """ This function times the preprocessing of one synthetic z-stack channel (Z, X, Y) and checks the results are equal.
+    Returns (one view scipy, one view, all views scipy, all views batch, float64 blur, integer blur) times in seconds.
+    """
+    im = make_stack(xy, z, channels=1)[0]
+    view = np.ascontiguousarray(im[:, :, xy//2])
+    sigma = 1
+
+    assert filters.threshold_otsu(gaussian_filter(view, sigma)) == otsu(blur(view, sigma))
+    assert np.array_equal(views_scipy(im, sigma), views_batch(im, sigma))
+
+    def best(func):
+        return min(timeit.repeat(func, number=1, repeat=repeat))
+
+    t_view_scipy = best(lambda: filters.threshold_otsu(gaussian_filter(view, sigma)))
+    t_view = best(lambda: otsu(blur(view, sigma)))
+    t_views_scipy = best(lambda: views_scipy(im, sigma))
+    t_views = best(lambda: views_batch(im, sigma))
+    t_f64 = best(lambda: gaussian_filter(im.astype(np.float64), sigma))
+    t_int = best(lambda: blur(im, sigma))
+    return t_view_scipy, t_view, t_views_scipy, t_views, t_f64, t_int
+
+def bench_stacked(n=256, shape=(30, 200), scale=1, repeat=3):
+    """ This function times the blur and otsu threshold of n small orthogonal views one at a time and stacked,
+    as wga_thickness.process_image and process_stack do, and checks the thresholds are equal.
+    input scale: intensity scale of the views, 1 for a range of about 4000, 10 for about 40000.
+    Returns (one at a time, stacked) times in seconds and the highest intensity of the views.
+    """
+    rng = np.random.default_rng(0)
+    layer = (np.arange(shape[0]) % 7 == 3)[:, np.newaxis]
+    views = [np.clip((rng.gamma(1.2, 50, shape) + layer * 2000) * scale, 0, 65535).astype(np.uint16) for _ in range(n)]
+    sigma = 1
+
+    def one_at_a_time():
+        return np.array([otsu(blur(view, sigma)) for view in views])
+
+    def stacked():
+        return otsu_batch(blur(np.stack(views), sigma, axes=(1, 2)), axis=0)
+
+    assert np.array_equal(one_at_a_time(), stacked())
+    t_one = min(timeit.repeat(one_at_a_time, number=1, repeat=repeat))
+    t_stacked = min(timeit.repeat(stacked, number=1, repeat=repeat))
+    return t_one, t_stacked, max(int(view.max()) for view in views)
+
+
+if __name__ == '__main__':
+    print('-'*20)
+    print(" {:>12} {:>22} {:>22} {:>22}".format("stack", "one view (ms)", "all views (ms)", "blur f64/int (ms)"))
+    for xy, z in [(256, 30), (512, 40), (1024, 40)]:
+        t = bench(xy, z)
+        print(" {:>12} {:>8.2f} {:>6.2f} {:>5.1f}x {:>8.0f} {:>6.0f} {:>5.1f}x {:>8.0f} {:>6.0f} {:>5.1f}x".format(
+            "{}x{}x{}".format(xy, xy, z), t[0]*1000, t[1]*1000, t[0]/t[1], t[2]*1000, t[3]*1000, t[2]/t[3],
+            t[4]*1000, t[5]*1000, t[4]/t[5]))
+    print('-'*20)
+    print(" {:>12} {:>10} {:>22}".format("views", "max", "one / stacked (ms)"))
+    for scale in (1, 10):
+        t_one, t_stacked, high = bench_stacked(scale=scale)
+        print(" {:>12} {:>10} {:>8.0f} {:>6.0f} {:>5.1f}x".format("256x30x200", high, t_one*1000, t_stacked*1000,
+                                                                 t_one/t_stacked))
+    print('-'*20)
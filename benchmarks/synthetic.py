@@ -0,0 +1,88 @@
+"""
+Synthetic glycocalyx-like z-stacks for the benchmarks.
+A stack has a fluorescent layer of varying height and thickness over a noisy background, covering a fraction of the
+XY positions with a brightness from dim to full signal, and split into a basal and an apical layer in a fraction of the
+positions, like the bilayer expression the thickness analyses measure.
+Stacks are returned as arrays (channel, Z, Y, X) or written as tif files that read_tif_channel reads.
+"""
+import os
+
+import numpy as np
+
+
+def smooth_field(shape, low, high, rng, cell=32):
+    """ This function returns a smooth random field between low and high, e.g. the height of the layer.
+    input shape: (Y, X) shape of the field.
+    input low, high: range of the values.
+    input rng: numpy random Generator.
+    input cell: size in pixels of the random features.
+    """
+    from scipy.ndimage import zoom
+
+    coarse = rng.random((max(2, shape[0]//cell + 1), max(2, shape[1]//cell + 1)))
+    field = zoom(coarse, (shape[0]/coarse.shape[0], shape[1]/coarse.shape[1]), order=1)[:shape[0], :shape[1]]
+    return low + (high - low) * field
+
+def make_stack(xy=512, z=40, channels=2, coverage=0.6, bilayer=0.3, noise=50, signal=4000, rng=None):
+    """ This function returns a synthetic glycocalyx-like z-stack.
+    input xy: size of the X and Y axes in pixels.
+    input z: number of z-slices.
+    input channels: number of channels, channel c has signal/(c+1) intensity.
+    input coverage: fraction of the XY positions covered by the layer.
+    input bilayer: fraction of the XY positions where the layer is split into basal and apical layers.
+    input noise: standard deviation of the background noise.
+    input signal: intensity of the layer in the first channel, 0 for a negative control.
+    input rng: numpy random Generator, None for a fixed seed.
+    Returns a uint16 array (channel, Z, Y, X).
+    """
+    rng = np.random.default_rng(0) if rng is None else rng
+    shape = (xy, xy)
+
+    # Layer from bottom to top in z, thickness of a few slices.
+    bottom = smooth_field(shape, 0.2*z, 0.4*z, rng)
+    thickness = smooth_field(shape, 0.1*z, 0.3*z, rng)
+    # Bilayer positions, a gap of two slices in the middle of the layer.
+    split = smooth_field(shape, 0, 1, rng, cell=16) < bilayer
+    middle = bottom + thickness/2
+
+    zs = np.arange(z, dtype=np.float32)[:, np.newaxis, np.newaxis]
+    covered = smooth_field(shape, 0, 1, rng, cell=16) < coverage
+    layer = (zs >= bottom) & (zs < bottom + thickness) & covered
+    layer &= ~(split & (np.abs(zs - middle) < 1))
+    # Brightness of the layer varies from dim to full signal over XY.
+    brightness = smooth_field(shape, 0.02, 1, rng).astype(np.float32)
+
+    stack = np.empty((channels, z, xy, xy), np.uint16)
+    for c in range(channels):
+        im = rng.normal(100, noise, layer.shape).astype(np.float32)
+        im += layer * brightness * np.float32(signal/(c+1))
+        stack[c] = im.clip(0, 65535)
+    return stack
+
+def write_tif(tif_file, stack):
+    """ This function writes a stack (channel, Z, Y, X) as an uncompressed tif file, one page per channel and slice.
+    """
+    import tifffile
+
+    tifffile.imwrite(tif_file, stack, metadata={'axes': 'CZYX'})
+
+def make_folder(folder, n_images=4, xy=512, z=40, channels=2, coverage=0.6, bilayer=0.3, noise=50, seed=0):
+    """ This function writes a folder of synthetic tif stacks laid out like the data of the analyses:
+    a negative control (NC, no layer), a control (CON) and n_images image samples ('hr') of decreasing coverage.
+    input folder: folder of the tif files, created if needed.
+    input n_images: number of image samples.
+    input xy, z, channels, coverage, bilayer, noise: parameters of make_stack.
+    input seed: seed of the random stacks.
+    Returns a dictionary {"NC": files, "CON": files, "hr": files}.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    params = dict(xy=xy, z=z, channels=channels, bilayer=bilayer, noise=noise)
+
+    files = {"NC": [os.path.join(folder, "bench_NC.tif")], "CON": [os.path.join(folder, "bench_CON.tif")], "hr": []}
+    write_tif(files["NC"][0], make_stack(coverage=coverage, signal=0, rng=rng, **params))
+    write_tif(files["CON"][0], make_stack(coverage=coverage, rng=rng, **params))
+    for i in range(n_images):
+        files["hr"].append(os.path.join(folder, "bench_{}hr_{}.tif".format(6*(i+1), i)))
+        write_tif(files["hr"][-1], make_stack(coverage=coverage/(i+1), rng=rng, **params))
+    return files
@@ -0,0 +1,213 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from gcx_quant.profiling import merge_timings, run_timed, run_timed_alone
+
+
+def _init_worker():
+    """ This function reseeds numpy in every worker process.
+    Forked workers inherit the random state of the parent, so without this all workers would draw the same random lines.
+    """
+    np.random.seed()
+
+def read_ahead(file, block=2**20):
+    """ This function reads a file through and drops its bytes, so the file is in the page cache when a worker process
+    decodes it, e.g. from a network share. Only one block is held in memory at a time, errors are left to the worker.
+    input file: file name.
+    input block: number of bytes read at a time.
+    """
+    buffer = bytearray(block)
+    try:
+        with open(file, 'rb', buffering=0) as f:
+            while f.readinto(buffer):
+                pass
+    except OSError:
+        pass
+
+def prefetch_files(load, files, prefetch=2):
+    """ This function yields (file, future of load(file)) for every file, loading the next files in background threads.
+    At most prefetch files are loaded ahead of the file being consumed, which bounds the memory of waiting images.
+    input load: function reading the data of one file, e.g. decoding one channel of a czi image.
+    input files: list of file names.
+    input prefetch: number of files loaded ahead.
+    """
+    prefetch = max(1, prefetch)
+    with ThreadPoolExecutor(max_workers=prefetch) as readers:
+        futures = [readers.submit(load, file) for file in files[:prefetch]]
+        for i, file in enumerate(files):
+            future = futures[i]
+            # Start the next load before handing out this file, so reading overlaps its processing.
+            if i + prefetch < len(files):
+                futures.append(readers.submit(load, files[i + prefetch]))
+            futures[i] = None
+            yield file, future
+
+def run_batch(func, files, n_workers=None, load=None, prefetch=2, timings=None, **kwargs):
+    """ This function runs func(file, **kwargs) for every file in a process pool.
+    input func: module level function returning the result (e.g. one csv row) of one file.
+    input files: list of file names, results keep this order.
+    input n_workers: number of worker processes. None uses all cores, 1 runs in the current process.
+    input load: function reading the data of one file. When running in the current process, the next files are
+    read by load in background threads while func processes the current one, called as func(file, im=data, **kwargs).
+    Worker processes decode their own files, so decoding stays spread over the processes and no array is sent to them;
+    the raw bytes of the next files are read into the page cache by background threads meanwhile, with or without load.
+    input prefetch: number of files read ahead, decoded with load in the current process, only their bytes with workers.
+    input timings: list to which the time of the stages of every processed file is appended, None to not profile.
+    Files whose processing raises an error are reported and left out of the results,
+    returns (results, failed) where failed is a list of (file name, error message).
+    """
+    results = []
+    failed = []
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(files)))
+    work = partial(func, **kwargs)
+    if timings is not None:
+        # Stages are recorded in the process running the file and returned with its result. A worker process runs one
+        # file at a time, so its peak memory is reset per file; the current process reads other files meanwhile.
+        work = partial(run_timed_alone if n_workers > 1 else run_timed, work)
+        if load is not None:
+            load = partial(run_timed, load)
+
+    def collect(file, result, load_timing=None):
+        if timings is not None:
+            result, timing = result
+            if load_timing is not None:
+                merge_timings(timing, load_timing)
+            timings.append(dict(file_name=os.path.basename(file), **timing))
+        results.append(result)
+    
+    # Run in the current process, reading the next files while processing the current one.
+    if n_workers == 1 and load is not None:
+        for file, future in prefetch_files(load, files, prefetch):
+            try:
+                data = future.result()
+                load_timing = None
+                if timings is not None:
+                    data, load_timing = data
+                collect(file, work(file, im=data), load_timing)
+            except Exception as e:
+                print(" - Failed image {}: {}\n".format(file, e), end="")
+                failed.append((file, str(e)))
+        return results, failed
+
+    # Run in the current process, no pickling or process start up cost.
+    if n_workers == 1:
+        for file in files:
+            try:
+                collect(file, work(file))
+            except Exception as e:
+                print(" - Failed image {}: {}\n".format(file, e), end="")
+                failed.append((file, str(e)))
+        return results, failed
+    
+    # Workers decode their own files, while the raw bytes of the next files are read into the page cache.
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor, \
+            ThreadPoolExecutor(max_workers=max(1, prefetch)) as readers:
+        futures = [executor.submit(work, file) for file in files]
+        # Files after the ones the workers start with, at most prefetch files ahead of the collected ones.
+        ahead = n_workers
+        # Collect results in submission order so the csv rows follow the file list.
+        for i, (file, future) in enumerate(zip(files, futures)):
+            while ahead < min(len(files), i + n_workers + prefetch):
+                readers.submit(read_ahead, files[ahead])
+                ahead += 1
+            try:
+                collect(file, future.result())
+            except Exception as e:
+                print(" - Failed image {}: {}\n".format(file, e), end="")
+                failed.append((file, str(e)))
+    return results, failed
+
+def run_stacked(func, files, batch=256, n_workers=None, load=None, prefetch=2, timings=None, **kwargs):
+    """ This function runs func(files, ims=arrays, **kwargs) on stacks of same-shape images, e.g. hundreds of small
+    orthogonal views, so each stack is processed in a few numpy calls instead of paying the python cost of every file.
+    Files are read by load in background threads in the current process, and collected by the shape of their array.
+    A stack is processed once it holds batch images, and the remaining stacks after the last file.
+    input func: module level function processing one stack, called with the list of file names and the list of their
+    arrays, returning one result per file in the same order.
+    input files: list of file names, results keep this order.
+    input batch: largest number of images in one stack.
+    input n_workers: number of worker processes stacks are processed in. None uses all cores, 1 runs in the current process.
+    input load: function reading the array of one file.
+    input prefetch: number of files read ahead with load.
+    input timings: list to which the time of the stages of every processed stack is appended, None to not profile.
+    Returns (results, failed) like run_batch. A file that cannot be read fails on its own, an error of func fails
+    every file of the stack.
+    """
+    if load is None:
+        raise ValueError("run_stacked needs the load function of the files.")
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    work = partial(func, **kwargs)
+    if timings is not None:
+        # As in run_batch, the peak memory is reset per stack in worker processes only.
+        work = partial(run_timed_alone if n_workers > 1 else run_timed, work)
+        load = partial(run_timed, load)
+
+    executor = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) if n_workers > 1 else None
+
+    done = {}
+    failed = []
+    # Stacks are submitted to the pool as they fill up, or processed at once in the current process.
+    # Only their file names and load timings are kept, the arrays are released once processed.
+    submitted = []
+
+    def submit(stack):
+        stack_files = [file for file, _, _ in stack]
+        ims = [data for _, data, _ in stack]
+        load_timings = [load_timing for _, _, load_timing in stack]
+        if executor is not None:
+            submitted.append((stack_files, load_timings, executor.submit(work, stack_files, ims=ims)))
+            return
+        try:
+            submitted.append((stack_files, load_timings, work(stack_files, ims=ims)))
+        except Exception as e:
+            submitted.append((stack_files, load_timings, e))
+
+    try:
+        stacks = {}
+        for file, future in prefetch_files(load, files, prefetch):
+            try:
+                data = future.result()
+                load_timing = None
+                if timings is not None:
+                    data, load_timing = data
+            except Exception as e:
+                print(" - Failed image {}: {}\n".format(file, e), end="")
+                failed.append((file, str(e)))
+                continue
+            # Images are stacked with the images of the same shape and type only.
+            key = (np.shape(data), np.asarray(data).dtype.str)
+            stacks.setdefault(key, []).append((file, data, load_timing))
+            if len(stacks[key]) >= batch:
+                submit(stacks.pop(key))
+        for stack in stacks.values():
+            submit(stack)
+        stacks = None
+
+        for stack_files, load_timings, result in submitted:
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                if executor is not None:
+                    result = result.result()
+                if timings is not None:
+                    result, timing = result
+                    for load_timing in load_timings:
+                        merge_timings(timing, load_timing)
+                    timings.append(dict(file_name="{} (stack of {})".format(os.path.basename(stack_files[0]),
+                                                                           len(stack_files)), **timing))
+                done.update(zip(stack_files, result))
+            except Exception as e:
+                for file in stack_files:
+                    print(" - Failed image {}: {}\n".format(file, e), end="")
+                    failed.append((file, str(e)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return [done[file] for file in files if file in done], failed
@@ -0,0 +1,159 @@
+import hashlib
+import os
+
+import numpy as np
+
+from gcx_quant.histogram import intensity_counts
+from gcx_quant.profiling import stage
+from gcx_quant.reader import project_czi
+from gcx_quant.tiles import projection_counts
+
+# Default size limit of the cached arrays, 2 GiB.
+MAX_BYTES = 2 * 2**30
+
+
+def default_cache_dir():
+    """ This function returns the cache folder of the user, $XDG_CACHE_HOME/gcx_quant or ~/.cache/gcx_quant,
+    so no cache is written into the folders of the images, often on a shared or read-only share.
+    """
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "gcx_quant")
+
+def file_hash(file_name, chunk=2**24):
+    """ This function returns a hash of the content of a file, used as cache key.
+    The file is read in chunks without decoding it, which is much faster than decoding a czi image.
+    input file_name: file name.
+    input chunk: number of bytes read at a time.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _projection_counts(czi_file, channel_index, projection, tile):
+    """ This function decodes and counts the z-projection of a czi image, region by region when tile is given.
+    """
+    if tile is not None:
+        return projection_counts(czi_file, channel_index, projection, tile)
+    return intensity_counts(project_czi(czi_file, channel_index, projection))
+
+def _load_counts(cache_file):
+    """ This function reads counts saved by _save_counts, None if they are not cached.
+    """
+    try:
+        with np.load(cache_file) as cached:
+            return cached["values"], cached["counts"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _save_counts(cache_file, values, counts):
+    """ This function saves counts, through a temporary file so an interrupted run never leaves a broken cache entry.
+    """
+    tmp_file = "{}.{}.tmp.npz".format(cache_file[:-len(".npz")], os.getpid())
+    np.savez(tmp_file, values=values, counts=counts)
+    os.replace(tmp_file, cache_file)
+
+def control_counts(czi_file, channel_index=0, projection='max', cache_dir=None, tile=None):
+    """ This function returns the intensity counts of the z-projection of a control image, e.g. the negative control.
+    The projection is decoded and counted once, the counts are saved in cache_dir keyed by the file path, size and
+    modification time like array_key, so later runs over the same files neither decode nor read them.
+    A file that is copied or touched is looked up by its content hash, and decoded only if its content changed.
+    Histograms over any bins are derived from the counts with rebin_counts.
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'sum' or 'mean'.
+    input cache_dir: folder of the cached counts, None to not cache.
+    input tile: count the projection of large mosaics region by region, tile x tile pixels at a time, None to project
+    the whole image at once. Counts are the same either way.
+    Returns (values, counts) as intensity_counts.
+    """
+    if cache_dir is None:
+        return _projection_counts(czi_file, channel_index, projection, tile)
+
+    key = array_key(control_counts, czi_file, channel_index=channel_index, projection=projection)
+    cache_file = os.path.join(cache_dir, "counts_{}.npz".format(key))
+    cached = _load_counts(cache_file)
+    if cached is not None:
+        return cached
+
+    # Hashing reads the whole file, still much faster than decoding it.
+    hash_file = os.path.join(cache_dir, "counts_{}_c{}_{}.npz".format(file_hash(czi_file), channel_index, projection))
+    cached = _load_counts(hash_file)
+    if cached is not None:
+        values, counts = cached
+    else:
+        values, counts = _projection_counts(czi_file, channel_index, projection, tile)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if cached is None:
+        _save_counts(hash_file, values, counts)
+    _save_counts(cache_file, values, counts)
+    return values, counts
+
+def array_key(func, file_name, **params):
+    """ This function returns the cache key of func(file_name, **params).
+    The key is a hash of the function name, the file path, size and modification time, and the parameters,
+    so a file that is replaced or changed gets a new key without reading its content.
+    """
+    stat = os.stat(file_name)
+    parts = [func.__name__, os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns]
+    parts += ["{}={!r}".format(name, params[name]) for name in sorted(params)]
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+def evict(cache_dir, max_bytes):
+    """ This function removes the least recently used arrays of cache_dir until they take at most max_bytes.
+    input cache_dir: folder of the cached arrays.
+    input max_bytes: size limit of the cached arrays in bytes.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.startswith("array_") and ".tmp." not in entry.name:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    # Cached arrays are touched when they are used, so the oldest modification time is the least recently used.
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # Removed by another process, or still open on a system that locks mapped files.
+            continue
+        total -= size
+
+def cached_array(func, file_name, cache_dir=None, max_bytes=MAX_BYTES, **params):
+    """ This function returns func(file_name, **params), e.g. a decoded channel or z-projection of a czi file,
+    through a cache of .npy files, so analysing the same files again reads the arrays instead of decoding them.
+    Cached arrays are memory-mapped read-only. The least recently used arrays are removed when the cache is over max_bytes.
+    input func: function reading an array from a file, e.g. read_czi_channel or project_czi.
+    input file_name: file name.
+    input cache_dir: folder of the cached arrays, None to not cache.
+    input max_bytes: size limit of the cached arrays in bytes.
+    input params: keyword arguments of func, part of the cache key.
+    """
+    if cache_dir is None:
+        return func(file_name, **params)
+
+    cache_file = os.path.join(cache_dir, "array_{}.npy".format(array_key(func, file_name, **params)))
+    try:
+        with stage("cache"):
+            im = np.load(cache_file, mmap_mode='r')
+            os.utime(cache_file)
+        return im
+    except (OSError, ValueError):
+        # Not cached yet, or removed by another process since.
+        pass
+
+    im = func(file_name, **params)
+
+    # Write to a temporary file first so an interrupted run never leaves a broken cache entry.
+    with stage("cache"):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = "{}.{}.tmp.npy".format(cache_file[:-len(".npy")], os.getpid())
+        np.save(tmp_file, im)
+        os.replace(tmp_file, cache_file)
+        evict(cache_dir, max_bytes)
+    return im
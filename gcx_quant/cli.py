@@ -0,0 +1,238 @@
+import argparse
+import os
+
+
+def add_common(parser):
+    """ This function adds the arguments shared by all analyses to a subcommand parser.
+    """
+    parser.add_argument("folders", nargs="*", default=["."], help="folders of the image files (default: current folder)")
+    parser.add_argument("-c", "--channel", type=int, default=0, help="index of the channel to be extracted (default: 0)")
+    parser.add_argument("-o", "--output", default=None, help="folder of the results (default: the folder of the images)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="analyse every folder of images under the folders")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only analyse images that are new or changed since the last run, recorded in a manifest")
+    parser.add_argument("--profile", action="store_true",
+                        help="save the time and memory of every stage per image next to the results and print a summary")
+    parser.add_argument("--store", default=None, metavar="DIR",
+                        help="also append the results, per-line and per-image detail to a columnar store in DIR")
+    parser.add_argument("--store-format", choices=["parquet", "feather"], default="parquet",
+                        help="file format of the store (default: parquet)")
+
+def add_cache(parser):
+    """ This function adds the cache arguments to a subcommand parser of czi analyses.
+    """
+    parser.add_argument("--cache-dir", default=None,
+                        help="folder of the cached decoded arrays, at most 2 GiB (default: ~/.cache/gcx_quant)")
+    parser.add_argument("--no-cache", action="store_true", help="decode every file on every run")
+
+def add_plots(parser):
+    """ This function adds the figure arguments to a subcommand parser of analyses saving figures.
+    """
+    parser.add_argument("--no-plots", action="store_true", help="do not save the figures, only the results")
+
+def add_tile(parser):
+    """ This function adds the tiled processing argument to a subcommand parser of czi analyses.
+    """
+    parser.add_argument("--tile", type=int, default=None, metavar="PIXELS",
+                        help="process large mosaic scans region by region, PIXELS x PIXELS at a time, in constant memory")
+
+def add_thickness(parser, k):
+    """ This function adds the thickness arguments to a subcommand parser.
+    """
+    parser.add_argument("-k", type=int, default=k, help="number of random lines (default: {})".format(k))
+    parser.add_argument("-s", "--sigma", type=float, default=1, help="standard deviation for Gaussian kernel (default: 1)")
+    parser.add_argument("--full-width", action="store_true", help="measure every column instead of k random lines")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random lines and bootstrap, the same lines for every image on every run and worker count")
+    parser.add_argument("--sampling", choices=["random", "unique", "stratified"], default="random",
+                        help="draw lines with replacement, without replacement or one per strip of the width (default: random)")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="N",
+                        help="add bootstrap confidence intervals of the average thickness from N resamples (default: 0, none)")
+    parser.add_argument("--ci", type=float, default=95, help="confidence level of the intervals in %% (default: 95)")
+
+def build_parser():
+    """ This function returns the parser of the gcx-quant command.
+    """
+    parser = argparse.ArgumentParser(prog="gcx-quant", description="Fluorescence quantification of confocal images.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("coverage", help="percent coverage with one threshold from the negative control and control")
+    add_common(p)
+    add_cache(p)
+    p.add_argument("-p", "--projection", choices=["max", "sum", "mean"], default="max", help="z-projection method (default: max)")
+    p.add_argument("--sweep", action="store_true", help="also save coverage vs. threshold curves")
+    p.add_argument("--sweep-n", type=int, default=500, help="number of thresholds of the sweep (default: 500)")
+    add_plots(p)
+    add_tile(p)
+
+    p = sub.add_parser("per-coverage", help="percent coverage with one threshold per image against the negative control")
+    add_common(p)
+    add_cache(p)
+    add_plots(p)
+    add_tile(p)
+    p.add_argument("-p", "--projection", choices=["max", "sum", "mean"], default="max", help="z-projection method (default: max)")
+
+    p = sub.add_parser("coverage-tif", help="percent coverage of tif images with one threshold")
+    add_common(p)
+    add_plots(p)
+
+    p = sub.add_parser("thickness-xz", help="basal, apical and single layer thickness of z-stack XZ views")
+    add_common(p)
+    add_cache(p)
+    add_thickness(p, 100)
+    p.add_argument("--all-planes", action="store_true", help="with --full-width, measure the XZ views at every Y plane")
+    p.add_argument("--maps", action="store_true",
+                   help="measure every (x, y) position of the stack and save layer count and thickness maps")
+    p.add_argument("--map-format", choices=["npy", "tif"], default="npy", help="file format of the maps (default: npy)")
+    p.add_argument("--noisy", choices=["stop", "skip"], default="stop",
+                   help="a noisy random line ends the measurement of the image or is only left out (default: stop)")
+
+    p = sub.add_parser("wga-thickness", help="thickness of orthogonal view images")
+    add_common(p)
+    add_cache(p)
+    add_thickness(p, 50)
+    add_plots(p)
+    p.add_argument("--batch", type=int, default=None, metavar="N",
+                   help="stack up to N images of the same size and process them together, faster for many small images")
+
+    p = sub.add_parser("mean-int", help="mean intensity of every image")
+    add_common(p)
+    add_cache(p)
+    p.add_argument("--all-channels", action="store_true", help="measure every channel of each image in one read, ignores -c")
+    p.add_argument("--per-slice", action="store_true", help="also save the statistics of every z-slice")
+    add_tile(p)
+    return parser
+
+def cache_dir(args, folder):
+    """ This function returns the cache folder of an analysis of folder.
+    """
+    if args.no_cache:
+        return None
+    if args.cache_dir is not None:
+        return args.cache_dir
+    from gcx_quant.cache import default_cache_dir
+    return default_cache_dir()
+
+# Groups of files each analysis needs in a folder, by a string in the file name.
+REQUIRED = {"coverage": ("NC", "CON", "hr"), "per-coverage": ("NC", "hr"), "coverage-tif": ("NC", "CON", "hr")}
+
+def separate_outputs(folders):
+    """ This function gives folders whose results files would overwrite each other their own output folder.
+    Results files are named by the first letters of the image folder, so e.g. plate1 and plate2 saving to the same
+    output folder both write pla_Con_Results.csv. Such folders save to a subfolder named after the image folder.
+    input folders: list of (folder, out_dir), out_dir None for the image folder.
+    Returns the list of (folder, out_dir).
+    """
+    from gcx_quant.files import folder_name
+
+    # Folders by output folder and results prefix, the shortest prefix the analyses use.
+    groups = {}
+    for folder, out_dir in folders:
+        key = (os.path.abspath(folder if out_dir is None else out_dir), folder_name(folder)[:3])
+        groups.setdefault(key, []).append(folder)
+
+    separated = []
+    for folder, out_dir in folders:
+        key = (os.path.abspath(folder if out_dir is None else out_dir), folder_name(folder)[:3])
+        if len(groups[key]) > 1:
+            same = [other for other in groups[key] if folder_name(other) == folder_name(folder)]
+            sub = folder_name(folder)
+            if len(same) > 1:
+                sub = "{}_{}".format(sub, same.index(folder) + 1)
+            out_dir = os.path.join(key[0], sub)
+            print(" - Results of folder {} go to {}, they would overwrite the results of another folder.".format(folder, out_dir))
+        separated.append((folder, out_dir))
+    return separated
+
+def find_folders(args):
+    """ This function returns the folders to analyse with their output folder, as a list of (folder, out_dir).
+    With args.recursive, every folder under args.folders holding the image files the analysis needs is returned,
+    and results go to the same relative folder under args.output.
+    Folders whose results would overwrite each other in the same output folder get their own subfolder.
+    """
+    if not args.recursive:
+        return separate_outputs([(folder, args.output) for folder in args.folders])
+
+    from gcx_quant.scanner import group_files, scan_tree
+
+    ext = "tif" if args.command == "coverage-tif" else "czi"
+    required = REQUIRED.get(args.command, ())
+    folders = []
+    for root in args.folders:
+        for folder, names in scan_tree(root, ext).items():
+            groups = group_files(names, required)
+            missing = [group for group in required if not groups[group]]
+            if missing:
+                print(" - Skip folder {}, no {} files.".format(folder, "/".join(missing)))
+                continue
+            out_dir = None if args.output is None else os.path.join(args.output, os.path.relpath(folder, root))
+            folders.append((folder, out_dir))
+    return separate_outputs(folders)
+
+def run_folder(args, folder, out_dir=None, timings=None):
+    """ This function runs the analysis of args.command on the image files of folder.
+    Analysis modules are imported here, so a call only loads the libraries its analysis needs.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    """
+    common = {"channel_index": args.channel, "out_dir": out_dir, "n_workers": args.workers, "timings": timings,
+              "store_dir": args.store, "store_format": args.store_format}
+    if args.incremental:
+        common["manifest_file"] = os.path.join(folder if out_dir is None else out_dir,
+                                               ".gcx_manifest_{}.json".format(args.command))
+
+    if args.command == "coverage":
+        from gcx_quant.ha_coverage import run_coverage
+        return run_coverage(folder, projection=args.projection, cache_dir=cache_dir(args, folder),
+                            sweep=args.sweep, sweep_n=args.sweep_n, plots=not args.no_plots, tile=args.tile, **common)
+    if args.command == "per-coverage":
+        from gcx_quant.ha_coverage import run_per_coverage
+        return run_per_coverage(folder, projection=args.projection, cache_dir=cache_dir(args, folder),
+                                plots=not args.no_plots, tile=args.tile, **common)
+    if args.command == "coverage-tif":
+        from gcx_quant.ha_coverage import run_coverage_tif
+        return run_coverage_tif(folder, plots=not args.no_plots, **common)
+    if args.command == "thickness-xz":
+        from gcx_quant.thickness_xz import run
+        return run(folder, k=args.k, simga_gauss=args.sigma, full_width=args.full_width, all_planes=args.all_planes,
+                   maps=args.maps, map_format=args.map_format, cache_dir=cache_dir(args, folder), seed=args.seed,
+                   sampling=args.sampling, noisy=args.noisy, n_boot=args.bootstrap, ci=args.ci, **common)
+    if args.command == "wga-thickness":
+        from gcx_quant.wga_thickness import run
+        return run(folder, k=args.k, simga_gauss=args.sigma, full_width=args.full_width,
+                   cache_dir=cache_dir(args, folder), plots=not args.no_plots, seed=args.seed, sampling=args.sampling,
+                   n_boot=args.bootstrap, ci=args.ci, batch=args.batch, **common)
+    if args.command == "mean-int":
+        from gcx_quant.mean_int import run
+        return run(folder, cache_dir=cache_dir(args, folder), all_channels=args.all_channels, per_slice=args.per_slice,
+                   tile=args.tile, **common)
+    raise ValueError("Unknown command {}".format(args.command))
+
+def main(argv=None):
+    """ This function is the entry point of the gcx-quant command.
+    Returns the exit status, 1 if an image failed.
+    """
+    args = build_parser().parse_args(argv)
+
+    status = 0
+    for folder, out_dir in find_folders(args):
+        print("Analysing folder {} ...".format(folder))
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+        try:
+            if args.profile:
+                from gcx_quant.files import folder_name
+                from gcx_quant.profiling import profile_run
+
+                name = "{}_{}".format(folder_name(folder), args.command)
+                with profile_run(folder if out_dir is None else out_dir, name) as timings:
+                    results, failed = run_folder(args, folder, out_dir, timings)
+            else:
+                results, failed = run_folder(args, folder, out_dir)
+        except Exception as e:
+            print(" - Failed folder {}: {}".format(folder, e))
+            status = 1
+            continue
+        if failed:
+            status = 1
+    return status
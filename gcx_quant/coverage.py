@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def coverage(im, thresholds, chunk=2**20):
+    """ This function returns the percent coverage of an image, the percentage of its pixels kept by the Tarbell method
+    (non-zero pixels with intensity above the threshold), for one or several thresholds in one pass over the data.
+    Result is the same as np.sum(im * (im > threshold) != 0) / im.size * 100, without the full-size temporaries.
+    input im: image array, e.g. the 2d z-projection of an image sample.
+    input thresholds: threshold, or sequence of thresholds.
+    input chunk: number of pixels compared at a time, whole rows along axis 0.
+    Returns the percent coverage, an array with one value per threshold if thresholds is a sequence.
+    """
+    im = np.asarray(im)
+    ts = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    counts = np.zeros(ts.size, dtype=np.int64)
+    if im.ndim == 0:
+        im = im.reshape(1)
+
+    # Rows are compared one block at a time into the same boolean buffer, so the block stays in cache for every threshold.
+    rows = max(1, chunk // max(1, im[0].size)) if im.shape[0] > 0 else 1
+    buf = np.empty((min(rows, im.shape[0]),) + im.shape[1:], dtype=bool)
+    for start in range(0, im.shape[0], rows):
+        block = im[start:start + rows]
+        out = buf[:block.shape[0]]
+        for i, t in enumerate(ts):
+            np.greater(block, t, out=out)
+            counts[i] += np.count_nonzero(out)
+        # Zero pixels are above a negative threshold, but are not kept.
+        if np.any(ts < 0):
+            zeros = block.size - np.count_nonzero(block)
+            counts[ts < 0] -= zeros
+
+    covp = counts / im.size * 100
+    if np.ndim(thresholds) == 0:
+        return covp[0]
+    return covp
+
+def coverage_curve(values, counts, thresholds):
+    """ This function returns the percent coverage of an image for many thresholds from its intensity counts,
+    so a whole coverage vs. threshold curve costs one histogram of the image and a search per threshold.
+    Result is the same as coverage(im, thresholds).
+    input values, counts: distinct intensities of the image and their number of pixels, from intensity_counts.
+    input thresholds: sequence of thresholds.
+    Returns an array with the percent coverage at each threshold.
+    """
+    ts = np.asarray(thresholds, dtype=float)
+    values = np.asarray(values)
+    # below[j] = number of pixels with the j smallest intensities.
+    below = np.concatenate(([0], np.cumsum(counts)))
+    total = below[-1]
+    above = total - below[np.searchsorted(values, ts, side='right')]
+
+    # Zero pixels are above a negative threshold, but are not kept.
+    zeros = np.sum(np.asarray(counts)[values == 0])
+    above = np.where(ts < 0, above - zeros, above)
+    return above / total * 100
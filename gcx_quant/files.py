@@ -0,0 +1,37 @@
+import csv
+import os
+
+from gcx_quant.profiling import stage
+
+
+def get_files(folder='.', ext='czi', con=''):
+    """ This function returns all image files under folder as a list of paths.
+    input folder: folder of the image files.
+    input ext: extension of file needs to be filtered.
+    input con: file name must contain string.
+    """
+    results = []
+    for file in os.scandir(folder):
+        if file.is_file() and file.name.endswith(ext) and con in file.name:
+            results.append(os.path.join(folder, file.name))
+    return results
+
+def folder_name(folder):
+    """ This function returns the name of folder, used to name the results files.
+    """
+    return os.path.basename(os.path.abspath(folder))
+
+def save_csv(csv_file, csv_columns, results):
+    """ This function saves the results of an analysis to a csv file, one row per result.
+    input csv_file: csv file name.
+    input csv_columns: column names, keys of the result dictionaries.
+    input results: list of result dictionaries.
+    """
+    try:
+        with stage("write"), open(csv_file, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=csv_columns)
+            writer.writeheader()
+            writer.writerows(results)
+        print(" Results are saved to {}.".format(csv_file))
+    except OSError:
+        print("Cannot save to csv file {}".format(csv_file))
@@ -0,0 +1,354 @@
+import os
+from functools import partial
+
+import numpy as np
+
+from gcx_quant.cache import cached_array, control_counts
+from gcx_quant.coverage import coverage, coverage_curve
+from gcx_quant.files import folder_name, get_files, save_csv
+from gcx_quant.manifest import incremental_batch
+from gcx_quant.histogram import histogram, intensity_counts, rebin_counts
+from gcx_quant.plots import defer_plot, plot_threshold, render_plots
+from gcx_quant.profiling import stage
+from gcx_quant.reader import project_czi, read_tif_channel
+from gcx_quant.store import save_store, split_details
+from gcx_quant.threshold import find_threshold
+
+
+def control_bins(max_intensity):
+    """ This function returns the histogram bins and bin centers of the threshold search.
+    input max_intensity: maximum intensity of the control.
+    Returns (bits, bins, xs).
+    """
+    # Find the max bit size of the control.
+    bits = np.floor(np.log2(max_intensity))
+    # bin size 500, should decrease or increase based on needs of resolution.
+    bins = np.linspace(0,2**bits,500)
+    # Reduce number of elements in the x axis, to match the number of y value.
+    xs = ( bins[:-1] + bins[1:] )/2
+    return bits, bins, xs
+
+def load_image(im_file, channel_index, projection, cache_dir=None, tile=None):
+    """ This function returns the z-projection of one channel of a czi image sample.
+    input im_file: czi file of the image sample.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'mean' or 'sum'.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input tile: return the intensity counts (values, counts) of the projection instead, counted region by region of
+    tile x tile pixels, for mosaics too large to project in memory. None returns the projection.
+    """
+    if tile is not None:
+        # Counts are cached like the ones of the controls.
+        return control_counts(im_file, channel_index, projection, cache_dir, tile)
+    # Z-projection of the extracted channel, folded slice by slice while decoding, or read from the cache.
+    return cached_array(project_czi, im_file, cache_dir, channel_index=channel_index, method=projection)
+
+def histogram_row(file_name, values, counts):
+    """ This function returns the row of the intensity histogram of one image, from intensity_counts.
+    """
+    return {"file_name": file_name, "values": np.asarray(values).tolist(), "counts": np.asarray(counts).tolist()}
+
+def process_image(im_file, channel_index, projection, threshold, cache_dir=None, im=None, tile=None, detail=False):
+    """ This function returns the percent coverage of one image sample above the threshold.
+    input im_file: czi file of the image sample.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'mean' or 'sum'.
+    input threshold: intensity threshold found from the negative control and the control.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input tile: measure the image from its intensity counts, counted region by region, see load_image.
+    input detail: also return the intensity histogram of the image, as (result, {"histograms": rows}).
+    """
+    print(" - Processing image {} ...\n".format(im_file), end="")
+
+    if im is None:
+        im = load_image(im_file, channel_index, projection, cache_dir, tile)
+
+    # Thresholding with the Tarbell method, percentage of pixels above the threshold in one pass over the image.
+    with stage("measurement"):
+        covp = coverage(im, threshold) if tile is None else coverage_curve(*im, [threshold])[0]
+
+    result = {"file_name" : os.path.basename(im_file), "coverage %" : covp, "threshold": threshold}
+    if detail:
+        with stage("histogram"):
+            values, counts = intensity_counts(im) if tile is None else im
+        return result, {"histograms": [histogram_row(result["file_name"], values, counts)]}
+    return result
+
+def process_image_sweep(im_file, channel_index, projection, threshold, sweep_thresholds, cache_dir=None, im=None,
+                        tile=None, detail=False):
+    """ This function returns the percent coverage of one image sample above the threshold,
+    and its coverage at every threshold of sweep_thresholds from one histogram of the image.
+    input im_file: czi file of the image sample.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'mean' or 'sum'.
+    input threshold: intensity threshold found from the negative control and the control.
+    input sweep_thresholds: thresholds of the coverage vs. threshold curve.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input tile: measure the image from its intensity counts, counted region by region, see load_image.
+    input detail: also return the intensity histogram of the image.
+    Returns (result, {"sweep": rows}), the result of process_image and one row per threshold of the sweep,
+    with the table "histograms" too if detail.
+    """
+    print(" - Processing image {} ...\n".format(im_file), end="")
+
+    if im is None:
+        im = load_image(im_file, channel_index, projection, cache_dir, tile)
+
+    # Coverage at every threshold from the cumulative intensity counts of the image.
+    with stage("histogram"):
+        values, counts = intensity_counts(im) if tile is None else im
+    with stage("measurement"):
+        covp = coverage_curve(values, counts, [threshold])[0]
+        sweep = coverage_curve(values, counts, sweep_thresholds)
+
+    file_name = os.path.basename(im_file)
+    rows = [{"file_name" : file_name, "threshold": t, "coverage %" : c} for t, c in zip(sweep_thresholds, sweep)]
+    tables = {"sweep": rows}
+    if detail:
+        tables["histograms"] = [histogram_row(file_name, values, counts)]
+    return {"file_name" : file_name, "coverage %" : covp, "threshold": threshold}, tables
+
+def process_image_per(im_file, NC_counts, channel_index, projection, out_dir='.', cache_dir=None, im=None, plots=True,
+                      tile=None, detail=False):
+    """ This function finds the threshold of one image sample against the negative control and returns its percent coverage.
+    input im_file: czi file of the image sample.
+    input NC_counts: (values, counts) intensity counts of the z-projection of the negative control, from control_counts.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'mean' or 'sum'.
+    input out_dir: folder of the threshold plot.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input plots: store the histograms of the threshold plot, rendered after the analysis by render_plots.
+    input tile: measure the image from its intensity counts, counted region by region, see load_image.
+    input detail: also return the intensity histogram of the image, as (result, {"histograms": rows}).
+    """
+    print(" - Processing image {} ...\n".format(im_file), end="")
+
+    if im is None:
+        im = load_image(im_file, channel_index, projection, cache_dir, tile)
+
+    with stage("histogram"):
+        # Highest intensity is the last of the counted values.
+        bits, bins, xs = control_bins(np.max(im) if tile is None else im[0][-1])
+
+        # Histogram of the negative control is counted once, only rebinned to the bins of each image.
+        y0 = rebin_counts(*NC_counts, bins)
+        y1 = histogram(im, bins) if tile is None else rebin_counts(*im, bins)
+
+    # Find threshold = intersection of negative control and control, intensity.
+    with stage("threshold"):
+        threshold, inters_y = find_threshold(xs, y0, y1)
+    file_name = os.path.basename(im_file)
+    if plots:
+        defer_plot("threshold", os.path.join(out_dir, 'Threshold{0}.png'.format(file_name)),
+                   xs=xs, y0=y0, y1=y1, threshold=threshold, inters_y=inters_y, axis_labels=True)
+
+    # Thresholding with the Tarbell method, percentage of pixels above the threshold in one pass over the image.
+    with stage("measurement"):
+        covp = coverage(im, threshold) if tile is None else coverage_curve(*im, [threshold])[0]
+
+    result = {"file_name" : file_name, "coverage %" : covp, "threshold": threshold}
+    if detail:
+        with stage("histogram"):
+            values, counts = intensity_counts(im) if tile is None else im
+        return result, {"histograms": [histogram_row(file_name, values, counts)]}
+    return result
+
+def process_image_tif(im_file, channel_index, threshold, im=None, detail=False):
+    """ This function returns the percent coverage of one tif image sample above the threshold.
+    input im_file: tif file of the image sample.
+    input channel_index: index of the channel to be extracted.
+    input threshold: intensity threshold found from the negative control and the control.
+    input im: image already read by read_tif_channel, None to read it here.
+    input detail: also return the intensity histogram of the image, as (result, {"histograms": rows}).
+    """
+    print(" - Processing image {} ...\n".format(im_file), end="")
+
+    if im is None:
+        # Uncompressed tifs are memory-mapped, only the channel is read.
+        im = read_tif_channel(im_file, channel_index)
+
+    # Thresholding with the Tarbell method, percentage of pixels above the threshold in one pass over the image.
+    with stage("measurement"):
+        covp = coverage(im, threshold)
+
+    result = {"file_name" : os.path.basename(im_file), "cov" : covp, "threshold": threshold}
+    if detail:
+        with stage("histogram"):
+            values, counts = intensity_counts(im)
+        return result, {"histograms": [histogram_row(result["file_name"], values, counts)]}
+    return result
+
+def run_coverage(folder='.', channel_index=0, projection='max', out_dir=None, n_workers=None, cache_dir=None,
+                 sweep=False, sweep_n=500, manifest_file=None, timings=None, plots=True, tile=None, store_dir=None,
+                 store_format='parquet'):
+    """ This function finds one threshold from the negative control (NC) and control (CON) czi images of folder
+    and saves the percent coverage of every image sample (file name containing 'hr').
+    input folder: folder of the czi files.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'mean' or 'sum'.
+    input out_dir: folder of the results and threshold plot, None for folder.
+    input n_workers: number of worker processes, None uses all cores.
+    input cache_dir: folder of the cached control counts and decoded arrays, None to decode every file.
+    input manifest_file: json manifest of the processed images, only new or changed images are processed, None to process all.
+    input sweep: also save the coverage of every image at sweep_n thresholds from 0 to the control bit range.
+    input sweep_n: number of thresholds of the sweep.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    input plots: save the threshold plot.
+    input tile: process large mosaics region by region, tile x tile pixels at a time, in constant memory.
+    Thresholds and coverages are the same as with the whole projection. None projects each image at once.
+    input store_dir: folder of the columnar results store the results and the intensity histograms of every image,
+    controls included, are also appended to. None to only save the csv.
+    input store_format: 'parquet' or 'feather', file format of the store.
+    Returns (results, failed) of run_batch.
+    """
+    out_dir = folder if out_dir is None else out_dir
+    NC_file = get_files(folder, con = 'NC')[0]
+    CON_file = get_files(folder, con = 'CON')[0]
+    im_files = get_files(folder, con = 'hr')
+
+    print("Finding threshold ... \n")
+    # Intensity counts of the z-projections of the negative control and control, read from the cache when the files were already counted.
+    NC_counts = control_counts(NC_file, channel_index, projection, cache_dir, tile)
+    CON_counts = control_counts(CON_file, channel_index, projection, cache_dir, tile)
+
+    with stage("histogram"):
+        bits, bins, xs = control_bins(CON_counts[0][-1])
+        y0 = rebin_counts(*NC_counts, bins)
+        y1 = rebin_counts(*CON_counts, bins)
+
+    # Find threshold = intersection of negative control and control, intensity.
+    with stage("threshold"):
+        threshold, inters_y = find_threshold(xs, y0, y1)
+    if plots:
+        plot_threshold(xs, y0, y1, threshold, inters_y, os.path.join(out_dir, 'Threshold.png'))
+
+    # Use threshold to find percent coverage on image samples, one image per worker process.
+    load = partial(load_image, channel_index=channel_index, projection=projection, cache_dir=cache_dir, tile=tile)
+    if sweep:
+        sweep_thresholds = np.linspace(0, 2**bits, sweep_n)
+        results, failed = incremental_batch(process_image_sweep, im_files, manifest_file, n_workers=n_workers, load=load,
+                                            channel_index=channel_index, projection=projection, threshold=threshold,
+                                            timings=timings, sweep_thresholds=sweep_thresholds, cache_dir=cache_dir,
+                                            tile=tile, detail=store_dir is not None)
+    else:
+        results, failed = incremental_batch(process_image, im_files, manifest_file, n_workers=n_workers, load=load,
+                                            timings=timings, channel_index=channel_index, projection=projection,
+                                            threshold=threshold, cache_dir=cache_dir, tile=tile,
+                                            detail=store_dir is not None)
+    results, details = split_details(results)
+    print(" Finished.")
+
+    print('-'*20)
+    name = folder_name(folder)
+    save_csv(os.path.join(out_dir, "{}_Single_Con_Results.csv".format(name[:4])), ['file_name', 'coverage %', 'threshold'], results)
+    if sweep:
+        # Long format, one row per image and threshold.
+        save_csv(os.path.join(out_dir, "{}_Sweep_Results.csv".format(name[:4])), ['file_name', 'threshold', 'coverage %'], details["sweep"])
+    if store_dir is not None:
+        controls = [histogram_row(os.path.basename(NC_file), *NC_counts), histogram_row(os.path.basename(CON_file), *CON_counts)]
+        details["histograms"] = controls + details.get("histograms", [])
+        save_store(store_dir, "coverage", folder, dict(results=results, **details), store_format)
+    return results, failed
+
+def run_per_coverage(folder='.', channel_index=0, projection='max', out_dir=None, n_workers=None, cache_dir=None,
+                     manifest_file=None, timings=None, plots=True, tile=None, store_dir=None, store_format='parquet'):
+    """ This function finds the threshold of every image sample (file name containing 'hr') of folder
+    against the negative control (NC) and saves their percent coverage.
+    input folder: folder of the czi files.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'mean' or 'sum'.
+    input out_dir: folder of the results and threshold plots, None for folder.
+    input n_workers: number of worker processes, None uses all cores.
+    input cache_dir: folder of the cached negative control counts and decoded arrays, None to decode every file.
+    input manifest_file: json manifest of the processed images, only new or changed images are processed, None to process all.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    input plots: save the threshold plot of every image, rendered in worker processes after the coverage is saved.
+    input tile: process large mosaics region by region, tile x tile pixels at a time, in constant memory.
+    Thresholds and coverages are the same as with the whole projection. None projects each image at once.
+    input store_dir: folder of the columnar results store the results and the intensity histograms of every image,
+    controls included, are also appended to. None to only save the csv.
+    input store_format: 'parquet' or 'feather', file format of the store.
+    Returns (results, failed) of run_batch.
+    """
+    out_dir = folder if out_dir is None else out_dir
+    NC_file = get_files(folder, con = 'NC')[0]
+    im_files = get_files(folder, con = 'hr')
+
+    print("Finding threshold ... \n")
+    # Intensity counts of the z-projection of the negative control, read from the cache when the file was already counted.
+    NC_counts = control_counts(NC_file, channel_index, projection, cache_dir, tile)
+
+    # Use threshold to find percent coverage on image samples, one image per worker process.
+    load = partial(load_image, channel_index=channel_index, projection=projection, cache_dir=cache_dir, tile=tile)
+    results, failed = incremental_batch(process_image_per, im_files, manifest_file, n_workers=n_workers, load=load,
+                                        timings=timings, NC_counts=NC_counts, channel_index=channel_index,
+                                        projection=projection, out_dir=out_dir, cache_dir=cache_dir, plots=plots,
+                                        tile=tile, detail=store_dir is not None)
+    results, details = split_details(results)
+    print(" Finished.")
+
+    print('-'*20)
+    csv_file = os.path.join(out_dir, "{}_Per_Con_Results.csv".format(folder_name(folder)[:4]))
+    save_csv(csv_file, ['file_name', 'coverage %', 'threshold'], results)
+    if store_dir is not None:
+        details["histograms"] = [histogram_row(os.path.basename(NC_file), *NC_counts)] + details.get("histograms", [])
+        save_store(store_dir, "per_coverage", folder, dict(results=results, **details), store_format)
+    # Threshold plots are rendered from the stored histograms once the results are saved.
+    if plots:
+        render_plots(out_dir, n_workers)
+    return results, failed
+
+def run_coverage_tif(folder='.', channel_index=0, out_dir=None, n_workers=None, manifest_file=None, timings=None,
+                     plots=True, store_dir=None, store_format='parquet'):
+    """ This function finds one threshold from the negative control (NC) and control (CON) tif images of folder
+    and saves the percent coverage of every image sample (file name containing 'hr').
+    input folder: folder of the tif files.
+    input channel_index: index of the channel to be extracted.
+    input out_dir: folder of the results and threshold plot, None for folder.
+    input n_workers: number of worker processes, None uses all cores.
+    input manifest_file: json manifest of the processed images, only new or changed images are processed, None to process all.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    input plots: save the threshold plot.
+    input store_dir: folder of the columnar results store the results and the intensity histograms of every image,
+    controls included, are also appended to. None to only save the csv.
+    input store_format: 'parquet' or 'feather', file format of the store.
+    Returns (results, failed) of run_batch.
+    """
+    out_dir = folder if out_dir is None else out_dir
+    NC_files = get_files(folder, ext = 'tif', con = 'NC')
+    CON_files = get_files(folder, ext = 'tif', con = 'CON')
+    im_files = get_files(folder, ext = 'tif', con = 'hr')
+
+    print("Finding threshold ... ")
+    NC = read_tif_channel(NC_files[0], channel_index)
+    CON = read_tif_channel(CON_files[0], channel_index)
+
+    with stage("histogram"):
+        bits, bins, xs = control_bins(np.max(CON))
+        y0 = histogram(NC, bins)
+        y1 = histogram(CON, bins)
+
+    # Find threshold = intersection of negative control and control, intensity.
+    with stage("threshold"):
+        threshold, inters_y = find_threshold(xs, y0, y1, select='last')
+    if plots:
+        plot_threshold(xs, y0, y1, threshold, inters_y, os.path.join(out_dir, 'Threshold.png'), xlim=30000, legend=True)
+
+    # Use threshold to find percent coverage on image samples, one image per worker process.
+    results, failed = incremental_batch(process_image_tif, im_files, manifest_file, n_workers=n_workers,
+                                        load=partial(read_tif_channel, channel_index=channel_index), timings=timings,
+                                        channel_index=channel_index, threshold=threshold, detail=store_dir is not None)
+    results, details = split_details(results)
+    print(" Finished.")
+
+    print('-'*20)
+    csv_file = os.path.join(out_dir, "{}_Single_Con_Results.csv".format(folder_name(folder)[:4]))
+    save_csv(csv_file, ['file_name', 'cov', 'threshold'], results)
+    if store_dir is not None:
+        controls = [histogram_row(os.path.basename(file), *intensity_counts(im)) for file, im in ((NC_files[0], NC), (CON_files[0], CON))]
+        details["histograms"] = controls + details.get("histograms", [])
+        save_store(store_dir, "coverage_tif", folder, dict(results=results, **details), store_format)
+    return results, failed
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def int_histogram(im, chunk=2**20):
+    """ This function returns the number of pixels of every intensity value of an integer image.
+    One bincount over the native integer data, the result can be rebinned to any bin layout with rebin.
+    input im: image of non-negative integers, e.g. uint16 confocal data.
+    input chunk: number of pixels counted at a time.
+    Returns counts, counts[v] = number of pixels with intensity v, for v = 0 ... max intensity.
+    """
+    im = np.asarray(im)
+    if im.dtype.kind not in 'biu':
+        raise ValueError("int_histogram needs an integer image, got {}.".format(im.dtype))
+    if im.dtype.kind == 'i' and im.size > 0 and im.min() < 0:
+        raise ValueError("int_histogram needs non-negative intensities.")
+
+    im = im.ravel()
+    length = int(im.max()) + 1 if im.size > 0 else 0
+    counts = np.zeros(length, dtype=np.intp)
+    # bincount converts its input to intp, counting in chunks keeps that copy small and in cache.
+    for start in range(0, im.size, chunk):
+        counts += np.bincount(im[start:start + chunk], minlength=length)
+    return counts
+
+def rebin(counts, bins):
+    """ This function returns the histogram over bins of the intensities counted by int_histogram.
+    Result is the same as np.histogram(im, bins=bins)[0]: bins include their left edge, the last bin also its right edge.
+    input counts: number of pixels of every intensity value, from int_histogram.
+    input bins: increasing bin edges, e.g. np.linspace(0, 2**bits, 500).
+    """
+    bins = np.asarray(bins, dtype=float)
+    # below[t] = number of pixels with intensity < t.
+    below = np.concatenate(([0], np.cumsum(counts)))
+
+    # Integer intensities v < edge are v < ceil(edge), intensities v <= last edge are v < floor(last edge) + 1.
+    edges = np.ceil(bins)
+    edges[-1] = np.floor(bins[-1]) + 1
+    edges = np.clip(edges, 0, counts.size).astype(np.intp)
+    return np.diff(below[edges])
+
+def histogram(im, bins):
+    """ This function returns the histogram of an image over bins, like np.histogram(im, bins=bins)[0].
+    Integer images go through int_histogram and rebin, other images through np.histogram.
+    input im: image array.
+    input bins: increasing bin edges.
+    """
+    im = np.asarray(im)
+    if im.dtype.kind in 'bu':
+        return rebin(int_histogram(im), bins)
+    y, _ = np.histogram(im, bins = bins)
+    return y
+
+def intensity_counts(im):
+    """ This function returns the distinct intensities of an image and their number of pixels.
+    It is the finest histogram of the image, any bin layout is derived from it with rebin_counts.
+    Integer images are counted with int_histogram, other images (e.g. mean projections) with np.unique.
+    input im: image array.
+    Returns (values, counts), values sorted in increasing order and of the image dtype.
+    """
+    im = np.asarray(im)
+    if im.dtype.kind in 'bu':
+        counts = int_histogram(im)
+        values = np.flatnonzero(counts)
+        return values.astype(im.dtype), counts[values]
+    return np.unique(im, return_counts=True)
+
+def merge_counts(a, b):
+    """ This function returns the intensity counts of two images together, e.g. two regions of a mosaic, from their counts.
+    Result is the same as intensity_counts of the pixels of both images.
+    input a, b: (values, counts) of each image, from intensity_counts.
+    """
+    values = np.union1d(a[0], b[0])
+    counts = np.zeros(values.size, dtype=np.int64)
+    # Values of each image are distinct, so each position is added to once per image.
+    counts[np.searchsorted(values, a[0])] += a[1]
+    counts[np.searchsorted(values, b[0])] += b[1]
+    return values, counts
+
+def rebin_counts(values, counts, bins):
+    """ This function returns the histogram over bins of the intensities counted by intensity_counts.
+    Result is the same as np.histogram(im, bins=bins)[0].
+    input values, counts: distinct intensities and their number of pixels.
+    input bins: increasing bin edges.
+    """
+    bins = np.asarray(bins, dtype=float)
+    # below[j] = number of pixels with the j smallest intensities.
+    below = np.concatenate(([0], np.cumsum(counts)))
+    edges = np.searchsorted(values, bins, side='left')
+    edges[-1] = np.searchsorted(values, bins[-1], side='right')
+    return np.diff(below[edges])
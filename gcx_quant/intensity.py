@@ -0,0 +1,88 @@
+import numpy as np
+
+from gcx_quant.histogram import int_histogram
+from gcx_quant.profiling import stage
+
+
+def median_counts(counts):
+    """ This function returns the median of the intensities counted by int_histogram, the same as np.median of the image.
+    input counts: number of pixels of every intensity value.
+    """
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan
+    cum = np.cumsum(counts)
+    # Values at the two middle positions, equal for an odd number of pixels.
+    lower = np.searchsorted(cum, (n - 1) // 2, side='right')
+    upper = np.searchsorted(cum, n // 2, side='right')
+    return (lower + upper) / 2
+
+def _stats(total, pixels, median):
+    """ This function returns the intensity statistics of pixels with the sum of their intensities total.
+    """
+    return {"Mean Intensity": total / pixels if pixels > 0 else np.nan, "Median Intensity": median,
+            "Integrated Density": total, "Pixels": pixels}
+
+def _add_counts(counts, more):
+    """ This function adds two int_histogram counts, the longer of the two sets the length of the result.
+    """
+    if more.size > counts.size:
+        counts, more = more, counts
+    counts[:more.size] += more
+    return counts
+
+def _median(counts, values):
+    """ This function returns the median of the pixels counted in counts and of the float pixels in the list values.
+    """
+    if not values:
+        return median_counts(counts)
+    # Pixels of integer images are added back from their counts.
+    values = values + [np.repeat(np.arange(counts.size), counts)]
+    return float(np.median(np.concatenate(values)))
+
+def intensity_stats_tiles(pieces):
+    """ This function returns the mean, median and integrated density (sum of intensities) of a stack and of each of its slices,
+    in one pass over pieces of the slices, e.g. the regions of the z-slices of a mosaic from iter_czi_tiles.
+    Integer pieces are summed in int64 and their medians found from the counts of every intensity,
+    so the stack is never converted to float64 or held in memory. The median of float pieces needs all their pixels.
+    Only the accumulation is timed as the "measurement" stage, pieces are read (e.g. decoded) between the stages.
+    input pieces: iterable of (slice index, 2d image), the pieces of a slice together make up the whole slice.
+    Returns (stack, per_slice): statistics {"Mean Intensity", "Median Intensity", "Integrated Density", "Pixels"}
+    of the whole stack, and a list of the statistics of each slice in the order of the slice indices.
+    """
+    # Sum, number of pixels, intensity counts and float pixels of every slice.
+    slices = {}
+    for index, im in pieces:
+        with stage("measurement"):
+            im = np.asarray(im)
+            total, pixels, counts, values = slices.get(index, (0, 0, np.zeros(0, np.intp), []))
+            if im.dtype.kind in 'u' or (im.dtype.kind == 'i' and (im.size == 0 or im.min() >= 0)):
+                total += int(np.sum(im, dtype=np.int64))
+                counts = _add_counts(counts, int_histogram(im))
+            else:
+                total += float(np.sum(im, dtype=np.float64))
+                values.append(im.ravel())
+            slices[index] = (total, pixels + im.size, counts, values)
+
+    with stage("measurement"):
+        per_slice = []
+        total = 0
+        pixels = 0
+        counts = np.zeros(0, np.intp)
+        values = []
+        for index in sorted(slices):
+            slice_total, slice_pixels, slice_counts, slice_values = slices.pop(index)
+            per_slice.append(_stats(slice_total, slice_pixels, _median(slice_counts, slice_values)))
+            total += slice_total
+            pixels += slice_pixels
+            counts = _add_counts(counts, slice_counts)
+            values.extend(slice_values)
+        return _stats(total, pixels, _median(counts, values)), per_slice
+
+def intensity_stats(slices):
+    """ This function returns the mean, median and integrated density of a stack and of each of its slices,
+    in one pass over the slices, e.g. the z-slices of one channel as they are decoded. See intensity_stats_tiles.
+    input slices: iterable of 2d images.
+    Returns (stack, per_slice) statistics of the whole stack and of each slice.
+    """
+    return intensity_stats_tiles(enumerate(slices))
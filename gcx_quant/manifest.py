@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from gcx_quant.batch import run_batch
+from gcx_quant.cache import file_hash
+
+
+def params_key(func, kwargs):
+    """ This function returns a hash of an analysis function and its parameters.
+    Arrays (e.g. control counts) are hashed by their content.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update("{}.{}".format(func.__module__, func.__name__).encode())
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        h.update(name.encode())
+        if isinstance(value, (tuple, list)) and any(isinstance(v, np.ndarray) for v in value):
+            value = [np.ascontiguousarray(v).tobytes() if isinstance(v, np.ndarray) else v for v in value]
+        elif isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value).tobytes()
+        h.update(repr(value).encode())
+    return h.hexdigest()
+
+def load_manifest(manifest_file):
+    """ This function returns the manifest of already processed files, an empty one if manifest_file does not exist.
+    """
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        print(" - Manifest {} is not readable, all files are processed again.".format(manifest_file))
+        return {}
+
+def _save_json(file_name, data, indent=None):
+    """ This function saves data as json, through a temporary file so an interrupted run never leaves a broken file.
+    """
+    tmp_file = "{}.{}.tmp".format(file_name, os.getpid())
+    with open(tmp_file, 'w') as f:
+        # numpy scalars of the results are saved as python numbers.
+        json.dump(data, f, indent=indent, default=lambda v: v.item() if isinstance(v, np.generic) else str(v))
+    os.replace(tmp_file, file_name)
+
+def save_manifest(manifest_file, manifest):
+    """ This function saves the manifest, through a temporary file so an interrupted run never leaves a broken manifest.
+    """
+    _save_json(manifest_file, manifest, indent=1)
+
+def detail_dir(manifest_file):
+    """ This function returns the folder of the detail files of a manifest, e.g. .gcx_manifest_coverage_detail.
+    """
+    return "{}_detail".format(os.path.splitext(manifest_file)[0])
+
+def save_detail(manifest_file, path, detail):
+    """ This function saves the detail tables of one file (e.g. per-line thickness, histograms) next to the manifest,
+    one json file per image, so the manifest only keeps the result rows and is small to rewrite.
+    input path: absolute path of the image.
+    input detail: dictionary {table: rows} returned with the result.
+    Returns the name of the detail file, relative to the detail folder.
+    """
+    name = "{}.json".format(hashlib.blake2b(path.encode(), digest_size=16).hexdigest())
+    os.makedirs(detail_dir(manifest_file), exist_ok=True)
+    _save_json(os.path.join(detail_dir(manifest_file), name), detail)
+    return name
+
+def load_detail(manifest_file, name):
+    """ This function reads the detail tables of one file saved by save_detail.
+    Returns {table: rows}, None if the detail file is missing or not readable.
+    """
+    try:
+        with open(os.path.join(detail_dir(manifest_file), name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def unchanged(entry, file_name, stat):
+    """ This function checks whether a file is the one recorded in a manifest entry.
+    Files with the same size and modification time are not read, other files are compared by their content hash.
+    Returns (same, hash), hash is None if the file was not read.
+    """
+    if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return True, entry["hash"]
+    if entry["size"] != stat.st_size:
+        return False, None
+    digest = file_hash(file_name)
+    return digest == entry["hash"], digest
+
+def incremental_batch(func, files, manifest_file=None, n_workers=None, load=None, prefetch=2, timings=None, runner=None,
+                      **kwargs):
+    """ This function runs func(file, **kwargs) like run_batch, but only on the files that are new or changed
+    since the last run with the same func and parameters, as recorded in manifest_file.
+    Results of unchanged files are taken from the manifest, so the results cover all files.
+    Results returned with their detail tables, as (result, {table: rows}), keep only the result row in the manifest,
+    the detail of every image is saved to its own file in the detail folder of the manifest, see save_detail.
+    input func: function processing one file, e.g. process_image.
+    input files: list of file names.
+    input manifest_file: json manifest of the processed files, None to process every file.
+    input n_workers: number of worker processes, None uses all cores.
+    input load, prefetch: reading of the next files while processing the current one, see run_batch.
+    input timings: list to which the time of the stages of every processed file is appended, None to not profile.
+    input runner: function running func on the files to process, called like run_batch, e.g. a partial of run_stacked.
+    None for run_batch.
+    input kwargs: parameters of func, part of the manifest key with func.
+    Returns (results, failed) like run_batch, results in the order of files.
+    """
+    runner = run_batch if runner is None else runner
+    if manifest_file is None:
+        return runner(func, files, n_workers=n_workers, load=load, prefetch=prefetch, timings=timings, **kwargs)
+
+    manifest = load_manifest(manifest_file)
+    key = params_key(func, {name: value for name, value in kwargs.items() if name != 'cache_dir'})
+
+    results = {}
+    todo = []
+    hashes = {}
+    for file in files:
+        path = os.path.abspath(file)
+        entry = manifest.get(path)
+        if entry is not None and entry["params"] == key:
+            same, digest = unchanged(entry, file, os.stat(file))
+            if same:
+                if "detail" not in entry:
+                    results[file] = entry["result"]
+                    continue
+                detail = load_detail(manifest_file, entry["detail"])
+                # Images whose detail file is lost are processed again.
+                if detail is not None:
+                    results[file] = (entry["result"], detail)
+                    continue
+            hashes[file] = digest
+        todo.append(file)
+    print(" - {} files unchanged since the last run, {} files to process.".format(len(results), len(todo)))
+
+    new_results, failed = runner(func, todo, n_workers=n_workers, load=load, prefetch=prefetch, timings=timings, **kwargs)
+    failed_files = {file for file, _ in failed}
+    for file, result in zip([file for file in todo if file not in failed_files], new_results):
+        stat = os.stat(file)
+        digest = hashes.get(file)
+        path = os.path.abspath(file)
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                 "hash": digest if digest is not None else file_hash(file), "params": key}
+        if isinstance(result, tuple):
+            entry["result"], detail = result
+            entry["detail"] = save_detail(manifest_file, path, detail)
+        else:
+            entry["result"] = result
+        manifest[path] = entry
+        results[file] = result
+    save_manifest(manifest_file, manifest)
+
+    return [results[file] for file in files if file in results], failed
@@ -0,0 +1,124 @@
+import os
+from functools import partial
+from itertools import groupby
+
+from gcx_quant.cache import cached_array
+from gcx_quant.files import folder_name, get_files, save_csv
+from gcx_quant.intensity import intensity_stats
+from gcx_quant.manifest import incremental_batch
+from gcx_quant.reader import count_czi_channels, iter_czi_channel_slices, read_czi_channel
+from gcx_quant.store import save_store
+from gcx_quant.tiles import channel_stats
+
+
+def load_image(czi_file, channel_index, cache_dir=None):
+    """ This function returns one channel of a czi image.
+    input czi_file: czi file of the image.
+    input channel_index: index of the channel to be extracted.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    """
+    # Decode only the defined channel to im, or read it from the cache.
+    return cached_array(read_czi_channel, czi_file, cache_dir, channel_index=channel_index)
+
+def _rows(file_name, channel_index, stack, per_slice):
+    """ This function returns the result row of one channel and the rows of its slices, from intensity_stats.
+    """
+    row = dict(file_name=file_name, channel=channel_index + 1, **stack)
+    slice_rows = [dict(file_name=file_name, channel=channel_index + 1, slice=index + 1, **stats)
+                  for index, stats in enumerate(per_slice)]
+    return row, slice_rows
+
+def process_image(czi_file, channel_index, cache_dir=None, im=None, all_channels=False, tile=None):
+    """ This function returns the mean, median and integrated density (sum) of the intensities of one czi image,
+    of the whole stack and of each z-slice, in one pass over the slices.
+    input czi_file: czi file of the image.
+    input channel_index: index of the channel to be extracted.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input all_channels: measure every channel of the image, reading the file once, instead of channel_index.
+    input tile: measure large mosaics region by region, tile x tile pixels at a time, in constant memory.
+    None decodes one z-slice at a time, or, with cache_dir, reads the whole channel from the cache (decoded first and
+    cached on the first run) before measuring its slices.
+    Returns (rows, slice_rows), one row per channel and one row per channel and slice.
+    """
+    print(" - Processing image {} ...\n".format(czi_file), end="")
+    file_name = os.path.basename(czi_file)
+
+    rows = []
+    slice_rows = []
+    if tile is not None:
+        # Sums and intensity counts of the regions add up to the statistics of the whole mosaic.
+        channels = range(count_czi_channels(czi_file)) if all_channels else [channel_index]
+        for index in channels:
+            stack, per_slice = channel_stats(czi_file, index, tile)
+            row, channel_rows = _rows(file_name, index, stack, per_slice)
+            rows.append(row)
+            slice_rows.extend(channel_rows)
+        return rows, slice_rows
+
+    if all_channels or (im is None and cache_dir is None):
+        # Slices are measured as they are decoded, one channel after the other.
+        channels = None if all_channels else [channel_index]
+        for index, slices in groupby(iter_czi_channel_slices(czi_file, channels), key=lambda item: item[0]):
+            stack, per_slice = intensity_stats(plane for _, _, plane in slices)
+            row, channel_rows = _rows(file_name, index if all_channels else channel_index, stack, per_slice)
+            rows.append(row)
+            slice_rows.extend(channel_rows)
+        return rows, slice_rows
+
+    if im is None:
+        im = load_image(czi_file, channel_index, cache_dir)
+
+    # Statistics of all pixels and of each z-slice.
+    stack, per_slice = intensity_stats(im if im.ndim > 2 else [im])
+    row, slice_rows = _rows(file_name, channel_index, stack, per_slice)
+    return [row], slice_rows
+
+def run(folder='.', channel_index=0, out_dir=None, n_workers=None, cache_dir=None, manifest_file=None, timings=None,
+        all_channels=False, per_slice=False, tile=None, store_dir=None, store_format='parquet'):
+    """ This function saves the mean intensity of every czi image of folder.
+    input folder: folder of the czi files.
+    input channel_index: index of the channel to be extracted.
+    input out_dir: folder of the results, None for folder.
+    input n_workers: number of worker processes, None uses all cores.
+    input cache_dir: folder of the cached decoded arrays, None to decode every file.
+    input manifest_file: json manifest of the processed images, only new or changed images are processed, None to process all.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    input all_channels: measure every channel of each image in one read, instead of channel_index.
+    input per_slice: also save the statistics of every z-slice to a _Slice_Results.csv.
+    input tile: measure large mosaics region by region, tile x tile pixels at a time, in constant memory.
+    input store_dir: folder of the columnar results store the results and the statistics of every z-slice are also
+    appended to, None to only save the csv.
+    input store_format: 'parquet' or 'feather', file format of the store.
+    Returns (results, failed), one result per image and channel.
+    """
+    out_dir = folder if out_dir is None else out_dir
+    czi_files = get_files(folder)
+
+    print('-'*20)
+    print(" - Channel of czi image: {}\n".format("all" if all_channels else channel_index))
+    print('-'*20)
+    print(" Image processing in progress ...\n")
+
+    # Run through all czi files in the folder, one image per worker process.
+    # Without the cache, all channels and mosaic regions, slices are read by process_image itself, in one pass over each file.
+    load = None if all_channels or tile is not None or cache_dir is None else partial(load_image, channel_index=channel_index,
+                                                                                      cache_dir=cache_dir)
+    results, failed = incremental_batch(process_image, czi_files, manifest_file, n_workers=n_workers, load=load,
+                                        timings=timings, channel_index=channel_index, cache_dir=cache_dir,
+                                        all_channels=all_channels, tile=tile)
+    slice_rows = [row for _, rows in results for row in rows]
+    results = [row for rows, _ in results for row in rows]
+    print(" Finished.")
+
+    print('-'*20)
+    name = folder_name(folder)
+    columns = ['file_name', 'Mean Intensity', 'channel', 'Median Intensity', 'Integrated Density', 'Pixels']
+    save_csv(os.path.join(out_dir, "{}_Con_Results.csv".format(name[:3])), columns, results)
+    if per_slice:
+        # Long format, one row per image, channel and z-slice.
+        save_csv(os.path.join(out_dir, "{}_Slice_Results.csv".format(name[:3])), columns[:3] + ['slice'] + columns[3:],
+                 slice_rows)
+    if store_dir is not None:
+        save_store(store_dir, "mean_int", folder, {"results": results, "slices": slice_rows}, store_format)
+    return results, failed
@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gcx_quant.profiling import stage
+
+# Folder of the figure data waiting to be rendered, under the folder of the results.
+PLOT_DIR = '.gcx_plots'
+
+
+def _pyplot():
+    """ This function returns matplotlib.pyplot with the non-interactive Agg backend, figures are only saved to files.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def plot_threshold(xs, y0, y1, threshold, inters_y, png_file, xlim=10000, axis_labels=False, legend=False):
+    """ This function saves the histograms of the negative control and control with their intersection (threshold).
+    input xs: intensity at the center of each bin.
+    input y0, y1: histograms of the negative control and control.
+    input threshold, inters_y: intersection of the histograms.
+    input png_file: image file name.
+    input xlim: upper limit of the intensity axis.
+    input axis_labels: add the axis labels.
+    input legend: add the legend.
+    """
+    with stage("plot"):
+        plt = _pyplot()
+
+        # Plot histogram of frequency vs. intensity. x axis - intensity, y axis - frequency.
+        fig, ax = plt.subplots()
+        ax.plot(xs,y0,'r',label='Negative Control')
+        ax.plot(xs,y1,'b',label='Control')
+
+        # Set x, y limits.
+        ax.set_xlim([0,xlim])
+        ax.set_ylim([0,100000])
+        if axis_labels:
+            ax.set_xlabel('Intensity')
+            ax.set_ylabel('Frequency')
+        if legend:
+            ax.legend()
+
+        ax.plot(threshold, inters_y, 'o', color="green")
+        fig.savefig(png_file, bbox_inches='tight')
+        plt.close(fig)
+
+def save_image(im, png_file, cmap='gray'):
+    """ This function saves an image, e.g. a filtered image, as a png file scaled from its minimum to maximum.
+    """
+    with stage("plot"):
+        _pyplot().imsave(png_file, im, cmap=cmap)
+
+# Functions rendering each kind of stored figure.
+RENDERERS = {"threshold": plot_threshold, "image": save_image}
+
+def defer_plot(kind, png_file, **data):
+    """ This function stores the data of a figure, rendered later by render_plots, so the analysis does not wait for matplotlib.
+    The data are saved to a .npz file in the PLOT_DIR folder next to png_file.
+    input kind: kind of figure, a key of RENDERERS.
+    input png_file: image file name of the figure.
+    input data: keyword arguments of the renderer besides png_file, arrays, numbers or strings.
+    """
+    with stage("plot"):
+        plot_dir = os.path.join(os.path.dirname(png_file), PLOT_DIR)
+        os.makedirs(plot_dir, exist_ok=True)
+        npz_file = os.path.join(plot_dir, os.path.basename(png_file) + '.npz')
+        # Write to a temporary file first so an interrupted run never leaves broken figure data.
+        tmp_file = "{}.{}.tmp.npz".format(npz_file[:-len('.npz')], os.getpid())
+        np.savez(tmp_file, kind=kind, png_file=os.path.basename(png_file), **data)
+        os.replace(tmp_file, npz_file)
+
+def render_plot(npz_file):
+    """ This function renders one figure stored by defer_plot next to its data folder and removes the data.
+    """
+    with np.load(npz_file) as f:
+        # Numbers and strings are stored as 0-d arrays.
+        data = {name: f[name].item() if f[name].ndim == 0 else f[name] for name in f.files}
+    kind = data.pop("kind")
+    data["png_file"] = os.path.join(os.path.dirname(os.path.dirname(npz_file)), data["png_file"])
+    RENDERERS[kind](**data)
+    os.remove(npz_file)
+
+def render_plots(out_dir, n_workers=None):
+    """ This function renders the figures stored by defer_plot in the folder of the results, in a pool of worker processes.
+    Figures left over by an interrupted run are rendered too.
+    input out_dir: folder of the results and figures.
+    input n_workers: number of worker processes. None uses all cores, 1 renders in the current process.
+    Returns a list of (figure data file, error message) of the figures that could not be rendered.
+    """
+    plot_dir = os.path.join(out_dir, PLOT_DIR)
+    try:
+        npz_files = sorted(entry.path for entry in os.scandir(plot_dir)
+                           if entry.name.endswith('.npz') and not entry.name.endswith('.tmp.npz'))
+    except FileNotFoundError:
+        return []
+    if not npz_files:
+        return []
+
+    print(" Rendering {} figures ...".format(len(npz_files)))
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(npz_files)))
+
+    failed = []
+    if n_workers == 1:
+        for npz_file in npz_files:
+            try:
+                render_plot(npz_file)
+            except Exception as e:
+                print(" - Failed figure {}: {}".format(npz_file, e))
+                failed.append((npz_file, str(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(render_plot, npz_file) for npz_file in npz_files]
+            for npz_file, future in zip(npz_files, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(" - Failed figure {}: {}".format(npz_file, e))
+                    failed.append((npz_file, str(e)))
+
+    # Remove the data folder once every figure is rendered.
+    try:
+        os.rmdir(plot_dir)
+    except OSError:
+        pass
+    return failed
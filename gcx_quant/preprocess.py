@@ -0,0 +1,115 @@
+import numpy as np
+
+from gcx_quant.histogram import int_histogram
+
+
+def blur(im, sigma, axes=None, truncate=4.0):
+    """ This function applies a Gaussian blur to an image along some of its axes.
+    The result is the one of scipy.ndimage.gaussian_filter: integer images are filtered to their own type,
+    rounded down after each axis, so the otsu thresholds are counted from integer histograms. Blurring only the axes
+    of the planes of a stack, e.g. axes=(0, 1) for the XZ views im[:, :, i], gives the blurred planes of all the views at once.
+    input im: image.
+    input sigma: standard deviation of the Gaussian kernel.
+    input axes: axes to blur, None for all axes.
+    input truncate: radius of the kernel in standard deviations.
+    """
+    from scipy.ndimage import gaussian_filter
+
+    im = np.asarray(im)
+    axes = range(im.ndim) if axes is None else [axis % im.ndim for axis in axes]
+    # scipy skips the axes whose sigma is 0.
+    sigmas = [sigma if axis in axes else 0 for axis in range(im.ndim)]
+    return gaussian_filter(im, sigmas, truncate=truncate)
+
+def _otsu_variance(counts, centers):
+    """ This function returns the between-class variance of every threshold of histograms along the last axis.
+    Same arithmetic as skimage.filters.threshold_otsu: float32 counts, float64 means.
+    """
+    counts = counts.astype(np.float32)
+    weighted = counts * centers
+
+    # Class probabilities and means for all possible thresholds.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight1 = np.cumsum(counts, axis=-1)
+        weight2 = np.cumsum(counts[..., ::-1], axis=-1)[..., ::-1]
+        mean1 = np.cumsum(weighted, axis=-1) / weight1
+        mean2 = (np.cumsum(weighted[..., ::-1], axis=-1) / weight2[..., ::-1])[..., ::-1]
+        variance12 = weight1[..., :-1] * weight2[..., 1:] * (mean1[..., :-1] - mean2[..., 1:]) ** 2
+    return variance12
+
+def otsu(im):
+    """ This function returns the otsu threshold of an image, computed from one bincount of its intensities.
+    Result is the same as skimage.filters.threshold_otsu(im), which it calls for float or negative images.
+    input im: image.
+    """
+    im = np.asarray(im)
+    if im.dtype.kind not in 'iu' or im.min() < 0:
+        from skimage import filters
+        return filters.threshold_otsu(im)
+
+    low, high = int(im.min()), int(im.max())
+    # A single intensity value is its own threshold.
+    if low == high:
+        return im.reshape(-1)[0]
+
+    centers = np.arange(low, high + 1)
+    counts = int_histogram(im)[low:]
+    return centers[np.argmax(_otsu_variance(counts, centers))]
+
+def otsu_batch(stack, axis=0, chunk=2**17):
+    """ This function returns the otsu threshold of every slice of a stack of integer images, e.g. the XZ views of a z-stack.
+    The histograms of a block of slices are counted by one bincount into a 2d array, each slice in its own row over
+    its own intensity range, and the thresholds found together. Slices are taken in the order of their intensity range,
+    so the rows of a block are about as wide as their own histograms. A slice whose intensity range is wider than its
+    number of pixels costs as much per histogram bin in a block as on its own, it is thresholded by otsu alone.
+    Result is the same as [otsu(im) for im in slices along axis].
+    input stack: array of non-negative integer images.
+    input axis: axis of the stack the slices are taken across.
+    input chunk: largest number of histogram cells (rows x bins) and of pixels of a block, limits the memory of the histograms.
+    Returns an int64 array of thresholds, one per slice.
+    """
+    stack = np.moveaxis(np.asarray(stack), axis, 0)
+    n = stack.shape[0]
+    flat = stack.reshape(n, -1)
+    lows = flat.min(axis=1).astype(np.int64)
+    highs = flat.max(axis=1).astype(np.int64)
+    if stack.dtype.kind not in 'iu' or (n > 0 and lows.min() < 0):
+        return np.array([otsu(im) for im in stack])
+
+    thresholds = lows.copy()
+    ranges = highs - lows + 1
+    pixels = max(1, flat.shape[1])
+    order = np.argsort(ranges, kind='stable')
+    wide = order[ranges[order] > pixels]
+    for i in wide:
+        thresholds[i] = otsu(flat[i])
+    order = order[:order.size - wide.size]
+
+    n = order.size
+    start = 0
+    while start < n:
+        # Rows of the block are as wide as its widest slice, the widest one is the last in range order.
+        rows = max(1, chunk // max(int(ranges[order[start]]), pixels))
+        length = int(ranges[order[min(start + rows, n) - 1]])
+        rows = max(1, min(rows, chunk // length))
+        index = order[start:start + rows]
+        length = int(ranges[index].max())
+        start += index.size
+        m = index.size
+        # Slices with a single intensity value keep it as threshold.
+        if length == 1:
+            continue
+
+        # Histogram of each slice in its own row: intensities are shifted by the row offset and counted in one bincount.
+        block_lows = lows[index, np.newaxis]
+        offsets = np.arange(m, dtype=np.intp)[:, np.newaxis] * length - block_lows
+        counts = np.bincount((flat[index].astype(np.intp) + offsets).ravel(), minlength=m * length).reshape(m, length)
+
+        # Thresholds of slice i are searched between its own lowest and highest intensities, as otsu trims its histogram.
+        positions = np.arange(length - 1)
+        inside = positions < (ranges[index, np.newaxis] - 1)
+        centers = block_lows + np.arange(length)
+        variance12 = np.where(inside, _otsu_variance(counts, centers), -np.inf)
+        found = block_lows[:, 0] + np.argmax(variance12, axis=1)
+        thresholds[index] = np.where(ranges[index] == 1, block_lows[:, 0], found)
+    return thresholds
@@ -0,0 +1,185 @@
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage records of the file being processed by each thread, None when the thread is not profiled.
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """ This function times one stage of the processing of a file (e.g. read, blur, threshold) when profiling is on.
+    Wall time, CPU time of the thread and number of calls are added up per stage name, stages should not be nested.
+    Outside of start_profile/run_timed it does nothing.
+    input name: name of the stage.
+    """
+    records = getattr(_local, 'records', None)
+    if records is None:
+        yield
+        return
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        record = records.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+        record["calls"] += 1
+        record["wall"] += time.perf_counter() - wall
+        record["cpu"] += time.thread_time() - cpu
+
+def reset_peak_rss():
+    """ This function resets the peak resident memory of the process where the system allows it (Linux).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    """ This function returns the peak resident memory of the process in MB, since the last reset_peak_rss on Linux.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return float('nan')
+    # ru_maxrss is in kB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def start_profile(reset_peak=False):
+    """ This function starts recording the stages run by the current thread.
+    input reset_peak: reset the peak memory of the process first, only when nothing else runs in the process meanwhile,
+    as the peak is the one of the whole process.
+    Returns the records of an enclosing profile, to be given back to stop_profile.
+    """
+    previous = getattr(_local, 'records', None)
+    _local.records = {}
+    if reset_peak:
+        reset_peak_rss()
+    return previous
+
+def stop_profile(previous=None, scope="run"):
+    """ This function stops recording the stages run by the current thread.
+    input scope: what the peak memory covers, "file" when it was reset for the file alone, "run" for the process since
+    the start of the run.
+    Returns the timings {"stages": {stage: {"calls", "wall", "cpu"}}, "peak_rss_mb", "peak_rss_scope"}.
+    """
+    records = _local.records
+    _local.records = previous
+    return {"stages": records, "peak_rss_mb": peak_rss_mb(), "peak_rss_scope": scope}
+
+def run_timed(func, *args, **kwargs):
+    """ This function runs func(*args, **kwargs) and records the time of its stages.
+    Other files may be read or processed by other threads of the process meanwhile, so the peak memory is the one of
+    the process since the start of the run (scope "run").
+    Returns (result, timings), timings as stop_profile.
+    """
+    previous = start_profile()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        timings = stop_profile(previous)
+    return result, timings
+
+def run_timed_alone(func, *args, **kwargs):
+    """ This function runs func(*args, **kwargs) like run_timed in a process running nothing else meanwhile,
+    e.g. a worker process processing one file at a time. The peak memory is reset first, so it is the one of this call
+    alone (scope "file").
+    Returns (result, timings), timings as stop_profile.
+    """
+    previous = start_profile(reset_peak=True)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        timings = stop_profile(previous, "file")
+    return result, timings
+
+def merge_timings(timings, other):
+    """ This function adds the stage records of other to timings, e.g. the reading of a file done in another thread.
+    The peak memory is kept from timings, and only raised by other when both cover the same scope.
+    """
+    for name, record in other["stages"].items():
+        total = timings["stages"].setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+        for key in total:
+            total[key] += record[key]
+    if other.get("peak_rss_scope") == timings.get("peak_rss_scope"):
+        timings["peak_rss_mb"] = max(timings["peak_rss_mb"], other["peak_rss_mb"])
+    return timings
+
+def save_timings(out_dir, name, timings):
+    """ This function saves the timings of a run as {name}_Timings.json and, one row per file and stage, {name}_Timings.csv.
+    input out_dir: folder of the results.
+    input name: prefix of the files, e.g. the folder name.
+    input timings: list of {"file_name", "stages", "peak_rss_mb"}.
+    """
+    with open(os.path.join(out_dir, "{}_Timings.json".format(name)), 'w') as f:
+        json.dump(timings, f, indent=1)
+
+    csv_file = os.path.join(out_dir, "{}_Timings.csv".format(name))
+    with open(csv_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['file_name', 'stage', 'calls', 'wall (s)', 'cpu (s)', 'peak rss (MB)', 'peak rss scope'])
+        for timing in timings:
+            for stage_name, record in timing["stages"].items():
+                writer.writerow([timing["file_name"], stage_name, record["calls"], record["wall"], record["cpu"], timing["peak_rss_mb"],
+                                 timing.get("peak_rss_scope", "run")])
+    print(" Timings are saved to {}.".format(csv_file))
+
+def print_summary(timings, wall):
+    """ This function prints the total time of every stage over all files of a run.
+    input timings: list of {"file_name", "stages", "peak_rss_mb"}.
+    input wall: wall time of the whole run in seconds.
+    """
+    totals = {}
+    for timing in timings:
+        for stage_name, record in timing["stages"].items():
+            total = totals.setdefault(stage_name, {"calls": 0, "wall": 0.0, "cpu": 0.0})
+            for key in total:
+                total[key] += record[key]
+
+    print('-'*20)
+    # Peaks reset per file (worker processes) and peaks of the process since the start of the run are reported apart.
+    peaks = {}
+    for timing in timings:
+        scope = timing.get("peak_rss_scope", "run")
+        peaks[scope] = max(peaks.get(scope, 0), timing["peak_rss_mb"])
+    labels = {"file": "per file in worker processes", "run": "of the main process"}
+    print(" Run time {:.2f} s, {} files, peak memory {}".format(
+        wall, sum(timing["file_name"] != "(run)" for timing in timings),
+        ", ".join("{} {:.0f} MB".format(labels[scope], peaks[scope]) for scope in sorted(peaks)) or "-"))
+    print(" {:<16}{:>8}{:>12}{:>12}".format("stage", "calls", "wall (s)", "cpu (s)"))
+    for stage_name, total in sorted(totals.items(), key=lambda item: -item[1]["wall"]):
+        print(" {:<16}{:>8}{:>12.3f}{:>12.3f}".format(stage_name, total["calls"], total["wall"], total["cpu"]))
+    print('-'*20)
+
+@contextmanager
+def profile_run(out_dir, name):
+    """ This function profiles a run of an analysis. It yields the list given as timings to the analysis,
+    adds the stages run by the current thread outside of the images (e.g. the control threshold, the csv) as file "(run)",
+    then saves the timings next to the results and prints their summary.
+    input out_dir: folder of the results.
+    input name: prefix of the timings files.
+    """
+    timings = []
+    wall = time.perf_counter()
+    # Nothing else runs yet, the peak of the main process covers the whole run from here.
+    previous = start_profile(reset_peak=True)
+    try:
+        yield timings
+    finally:
+        run = stop_profile(previous)
+    timings.append(dict(file_name="(run)", **run))
+    save_timings(out_dir, name, timings)
+    print_summary(timings, time.perf_counter() - wall)
@@ -0,0 +1,292 @@
+import warnings
+from itertools import groupby
+
+import numpy as np
+from czifile import CziFile
+
+from gcx_quant.profiling import stage
+
+
+def drop_empty_dim(arr: np.array) -> np.array:
+    '''
+    This function is used for dropping empty dimension (shape = 1) of the input array.
+    E.g., input array shape = [1, 1, 3, 4, 5] ==> [3, 4, 5] as output array shape
+
+    '''
+    with stage("drop_empty_dim"):
+        dims_to_sq = np.where(np.array(arr.shape) == 1)[0]
+        for dim_ in dims_to_sq[::-1]:
+            arr = np.squeeze(arr, axis= dim_)
+    return arr
+
+def _kept_axes(shape):
+    """ This function returns the axes of a czi array that drop_empty_dim keeps.
+    The first kept axis is the one indexed by channel_index (the channel axis of multi-channel images).
+    """
+    return [i for i, n in enumerate(shape) if n != 1]
+
+def _check_index(index, size):
+    """ This function checks index against an axis of length size and returns it as a positive index.
+    """
+    if not -size <= index < size:
+        raise IndexError("index {} is out of bounds for axis with size {}".format(index, size))
+    return index % size
+
+def _read_selection(czi, selection):
+    """ This function decodes only the subblocks of an open czi file that cover the selected indices.
+    input czi: open CziFile.
+    input selection: dictionary {axis of the full czi array: index along that axis}.
+    Returns the czi array with the selected axes removed, like czi.asarray()[selection] without decoding the rest.
+    """
+    with stage("read"):
+        shape = [n for axis, n in enumerate(czi.shape) if axis not in selection]
+        out = np.zeros(shape, czi.dtype)
+
+        for entry in czi.filtered_subblock_directory:
+            # Position of the subblock in the full array.
+            begin = [i - j for i, j in zip(entry.start, czi.start)]
+
+            # Skip subblocks outside the selection without decoding them.
+            if not all(begin[axis] <= index < begin[axis] + entry.shape[axis] for axis, index in selection.items()):
+                continue
+
+            tile = entry.data_segment().data(resize=True, order=0)
+            tile = tile[tuple(selection[axis] - begin[axis] if axis in selection else slice(None) for axis in range(tile.ndim))]
+
+            kept = [axis for axis in range(len(begin)) if axis not in selection]
+            index = tuple(slice(begin[axis], begin[axis] + n) for axis, n in zip(kept, tile.shape))
+            try:
+                out[index] = tile
+            except ValueError as e:
+                warnings.warn(str(e))
+    return out
+
+def read_czi_channel(czi_file, channel_index=0):
+    """ This function returns one channel of a czi image, decoding only the subblocks of that channel.
+    Result is the same as drop_empty_dim(CziFile(czi_file).asarray())[channel_index].
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    """
+    with CziFile(czi_file) as czi:
+        kept = _kept_axes(czi.shape)
+        channel_axis = kept[0]
+        selection = {channel_axis: _check_index(channel_index, czi.shape[channel_axis])}
+        im = _read_selection(czi, selection)
+    return drop_empty_dim(im)
+
+def read_czi_plane(czi_file, channel_index=0, axis=2, index=None):
+    """ This function returns one plane of one channel of a czi z-stack, decoding only the subblocks crossing the plane.
+    Result is the same as read_czi_channel(czi_file, channel_index).take(index, axis), e.g. the XZ view
+    im[:, :, im.shape[2]//2] with the default axis.
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input axis: axis of the channel array the plane is taken across.
+    input index: position of the plane along axis, None for the midpoint.
+    """
+    with CziFile(czi_file) as czi:
+        kept = _kept_axes(czi.shape)
+        channel_axis = kept[0]
+        plane_axis = kept[1 + axis]
+        if index is None:
+            index = czi.shape[plane_axis]//2
+        selection = {channel_axis: _check_index(channel_index, czi.shape[channel_axis]),
+                     plane_axis: _check_index(index, czi.shape[plane_axis])}
+        im = _read_selection(czi, selection)
+    return drop_empty_dim(im)
+
+def count_czi_channels(czi_file):
+    """ This function returns the number of channels of a czi image, the length of the axis indexed by channel_index.
+    """
+    with CziFile(czi_file) as czi:
+        return czi.shape[_kept_axes(czi.shape)[0]]
+
+def iter_czi_slices(czi_file, channel_index=0, axis=0):
+    """ This function yields the slices of one channel of a czi image one at a time, e.g. the z-stack slices.
+    Only one slice is decoded and held in memory at a time.
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input axis: axis of the channel array to iterate over, 0 for the z-stack slices.
+    """
+    with CziFile(czi_file) as czi:
+        kept = _kept_axes(czi.shape)
+        channel_axis = kept[0]
+        slice_axis = kept[1 + axis]
+        channel_index = _check_index(channel_index, czi.shape[channel_axis])
+        for index in range(czi.shape[slice_axis]):
+            yield drop_empty_dim(_read_selection(czi, {channel_axis: channel_index, slice_axis: index}))
+
+def iter_czi_channel_slices(czi_file, channels=None):
+    """ This function yields the z-slices of every channel of a czi image one at a time, channel after channel.
+    The file is opened once and only the subblocks of one slice are decoded at a time, so all the channels are read
+    in one pass over the file when each subblock holds one z-slice of one channel, as in confocal z-stacks.
+    input czi_file: czi file name.
+    input channels: indices of the channels to read, None for all channels.
+    Yields (channel index, slice index, slice); images with 2d channels yield one slice per channel.
+    """
+    with CziFile(czi_file) as czi:
+        kept = _kept_axes(czi.shape)
+        channel_axis = kept[0]
+        if channels is None:
+            channels = range(czi.shape[channel_axis])
+        for channel_index in [_check_index(index, czi.shape[channel_axis]) for index in channels]:
+            # Channel arrays of more than two axes are sliced across their first axis.
+            if len(kept) < 4:
+                yield channel_index, 0, drop_empty_dim(_read_selection(czi, {channel_axis: channel_index}))
+                continue
+            slice_axis = kept[1]
+            for index in range(czi.shape[slice_axis]):
+                yield channel_index, index, drop_empty_dim(_read_selection(czi, {channel_axis: channel_index, slice_axis: index}))
+
+def iter_czi_tiles(czi_file, channel_index=0, tile=4096):
+    """ This function yields one channel of a czi image, e.g. a tiled mosaic scan, region by region of the XY plane
+    and slice by slice within each region, so only one tile x tile region of one slice is held in memory at a time.
+    Each slice of a region is pasted from its subblocks in file order like czi.asarray(), so overlapping mosaic tiles
+    give the same pixels, and the regions put together are the same array as read_czi_channel(czi_file, channel_index).
+    Subblocks crossing the border of two regions are decoded for each of them.
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input tile: size in pixels of the square regions.
+    Yields (region, slice index, plane): region (y, x) is the position of the plane in the XY plane, slice index counts
+    the planes of the channel in the order of its axes before Y and X (the z-slices), 0 for a 2d channel.
+    """
+    if tile < 1:
+        raise ValueError("tile size must be at least one pixel, got {}.".format(tile))
+
+    with CziFile(czi_file) as czi:
+        kept = _kept_axes(czi.shape)
+        channel_axis = kept[0]
+        channel_index = _check_index(channel_index, czi.shape[channel_axis])
+        # Axes of the channel array: slices (e.g. Z) then the Y and X axes of the planes.
+        y_axis, x_axis = kept[-2], kept[-1]
+        slice_axes = kept[1:-2]
+        slice_shape = [czi.shape[axis] for axis in slice_axes]
+
+        # Position of every subblock of the channel in the full array, read once from the directory.
+        entries = []
+        for entry in czi.filtered_subblock_directory:
+            begin = [i - j for i, j in zip(entry.start, czi.start)]
+            if begin[channel_axis] <= channel_index < begin[channel_axis] + entry.shape[channel_axis]:
+                entries.append((entry, begin))
+        begins = np.array([begin for _, begin in entries], dtype=np.int64).reshape(len(entries), len(czi.shape))
+        ends = begins + np.array([entry.shape for entry, _ in entries], dtype=np.int64).reshape(begins.shape)
+
+        for y in range(0, czi.shape[y_axis], tile):
+            for x in range(0, czi.shape[x_axis], tile):
+                height = min(tile, czi.shape[y_axis] - y)
+                width = min(tile, czi.shape[x_axis] - x)
+                # Subblocks overlapping the region, in file order.
+                inside = ((begins[:, y_axis] < y + height) & (ends[:, y_axis] > y)
+                          & (begins[:, x_axis] < x + width) & (ends[:, x_axis] > x))
+
+                for number, position in enumerate(np.ndindex(*slice_shape)):
+                    selected = inside.copy()
+                    for axis, index in zip(slice_axes, position):
+                        selected &= (begins[:, axis] <= index) & (index < ends[:, axis])
+
+                    with stage("read"):
+                        plane = np.zeros((height, width), czi.dtype)
+                        for i in np.flatnonzero(selected):
+                            entry, begin = entries[i]
+                            tile_data = entry.data_segment().data(resize=True, order=0)
+                            # Overlap of the subblock and the region, in the coordinates of both.
+                            y0, y1 = max(y, begin[y_axis]), min(y + height, ends[i, y_axis])
+                            x0, x1 = max(x, begin[x_axis]), min(x + width, ends[i, x_axis])
+                            index = [0] * tile_data.ndim
+                            index[channel_axis] = channel_index - begin[channel_axis]
+                            for axis, value in zip(slice_axes, position):
+                                index[axis] = value - begin[axis]
+                            index[y_axis] = slice(y0 - begin[y_axis], y1 - begin[y_axis])
+                            index[x_axis] = slice(x0 - begin[x_axis], x1 - begin[x_axis])
+                            try:
+                                plane[y0 - y:y1 - y, x0 - x:x1 - x] = tile_data[tuple(index)]
+                            except ValueError as e:
+                                warnings.warn(str(e))
+                    yield (y, x), number, plane
+
+def _project(slices, method='max'):
+    """ This function folds slices into their z-projection one slice at a time.
+    input slices: iterable of 2d arrays of the same shape.
+    input method: 'max' for maximum intensity, 'sum' or 'mean' (float64) projection.
+    """
+    proj = None
+    n = 0
+    for im in slices:
+        with stage("projection"):
+            if proj is None:
+                if method == 'max':
+                    proj = im
+                else:
+                    # Accumulate in 64 bits like np.sum, so sums of uint16 slices do not overflow.
+                    if method == 'mean' or im.dtype.kind == 'f':
+                        dtype = np.float64
+                    elif im.dtype.kind == 'u':
+                        dtype = np.uint64
+                    else:
+                        dtype = np.int64
+                    proj = im.astype(dtype)
+            elif method == 'max':
+                np.maximum(proj, im, out=proj)
+            else:
+                np.add(proj, im, out=proj)
+        n += 1
+
+    if method == 'mean':
+        proj /= n
+    return proj
+
+def project_czi(czi_file, channel_index=0, method='max'):
+    """ This function returns the z-projection of one channel of a czi z-stack without loading the whole stack.
+    z-slices are folded into a running projection as they are decoded, so peak memory is one slice plus the result.
+    'max' gives the same array as np.max(read_czi_channel(czi_file, channel_index), axis=0).
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input method: 'max' for maximum intensity, 'sum' or 'mean' (float64) projection.
+    """
+    if method not in ('max', 'sum', 'mean'):
+        raise ValueError("Unknown projection method {}, use 'max', 'sum' or 'mean'.".format(method))
+    return _project(iter_czi_slices(czi_file, channel_index), method)
+
+def project_czi_tiles(czi_file, channel_index=0, method='max', tile=4096):
+    """ This function yields the z-projection of one channel of a czi image region by region, see iter_czi_tiles.
+    Peak memory is one region of one slice plus its projection, whatever the size of the mosaic.
+    The regions put together are the same array as project_czi(czi_file, channel_index, method).
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input method: 'max' for maximum intensity, 'sum' or 'mean' (float64) projection.
+    input tile: size in pixels of the square regions.
+    Yields (region, projection), region (y, x) is the position of the projection in the XY plane.
+    """
+    if method not in ('max', 'sum', 'mean'):
+        raise ValueError("Unknown projection method {}, use 'max', 'sum' or 'mean'.".format(method))
+    for region, planes in groupby(iter_czi_tiles(czi_file, channel_index, tile), key=lambda item: item[0]):
+        yield region, _project((plane for _, _, plane in planes), method)
+
+def read_tif_channel(tif_file, channel_index=0):
+    """ This function returns one channel of a tif image, im[channel_index] of the first image series.
+    Uncompressed tifs are memory-mapped, so only the pages of the channel are read from disk when used.
+    Other tifs are read page by page, only the pages of the channel are decoded.
+    Result is the same as tifffile.imread(tif_file)[channel_index].
+    input tif_file: tif file name.
+    input channel_index: index of the channel to be extracted.
+    """
+    import tifffile
+
+    with stage("read"):
+        try:
+            im = tifffile.memmap(tif_file, mode='r')
+        except ValueError:
+            # Compressed or not contiguous image data.
+            im = None
+        if im is not None:
+            return im[_check_index(channel_index, im.shape[0])]
+
+        with tifffile.TiffFile(tif_file) as tif:
+            series = tif.series[0]
+            index = _check_index(channel_index, series.shape[0])
+            pages = series.pages
+            per_channel = len(pages) // series.shape[0]
+            # A channel is a run of whole pages, decode only those.
+            if per_channel > 0 and per_channel * series.shape[0] == len(pages):
+                channel = [page.asarray() for page in pages[index * per_channel:(index + 1) * per_channel]]
+                return np.stack(channel).reshape(series.shape[1:])
+            return series.asarray()[index]
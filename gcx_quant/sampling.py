@@ -0,0 +1,78 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Ways of drawing the lines of an image, see sample_lines.
+SAMPLING = ("random", "unique", "stratified")
+
+
+def image_rng(seed, file_name):
+    """ This function returns the random generator of one image, seeded from seed and the name of the image file,
+    so every image draws the same lines whatever the order of the files or the worker process that measures it.
+    input seed: seed of the run, an integer.
+    input file_name: image file name, only its base name is used.
+    Returns a np.random.Generator.
+    """
+    digest = hashlib.blake2b(os.path.basename(file_name).encode(), digest_size=8).digest()
+    return np.random.default_rng([seed, int.from_bytes(digest, 'little')])
+
+def sample_lines(n, k, rng=None, method='random'):
+    """ This function returns the column indices of k lines drawn across an image of width n.
+    input n: number of columns of the image.
+    input k: number of lines.
+    input rng: np.random.Generator, None draws from numpy's global random state like np.random.randint.
+    input method: 'random' draws k columns with replacement, as the analyses always did.
+    'unique' draws min(k, n) different columns.
+    'stratified' splits the width into min(k, n) equal strata and draws one column in each, which spreads the lines
+    over the whole image and lowers the variance of the averages for the same number of lines.
+    Returns an int64 array of column indices.
+    """
+    if method not in SAMPLING:
+        raise ValueError("Unknown sampling {}, use {}.".format(method, ", ".join(repr(m) for m in SAMPLING)))
+    if rng is None:
+        # Global random state, reseeded in every worker process by run_batch.
+        rng = np.random
+
+    if method == 'random':
+        return rng.integers(n, size=k) if isinstance(rng, np.random.Generator) else rng.randint(n, size=k)
+    k = min(k, n)
+    if method == 'unique':
+        return np.asarray(rng.choice(n, size=k, replace=False), dtype=np.int64)
+    # One column per stratum [start, stop), strata differ in width by at most one column.
+    starts = np.arange(k) * n // k
+    stops = (np.arange(k) + 1) * n // k
+    return (starts + np.floor(rng.random(k) * (stops - starts))).astype(np.int64)
+
+def bootstrap_counts(values, counts, n_boot=1000, ci=95, rng=None):
+    """ This function returns the bootstrap percentile confidence interval of the mean of values given with their counts,
+    e.g. a thickness histogram. Resampling n values with replacement is the same as drawing the counts of every value
+    from a multinomial distribution, so all resamples are drawn at once in an (n_boot, values) array,
+    whatever the number of measured lines.
+    input values: distinct values.
+    input counts: number of occurrences of each value.
+    input n_boot: number of bootstrap resamples.
+    input ci: confidence level in %.
+    input rng: np.random.Generator, None for a new unseeded generator.
+    Returns (low, high), nan if there are no values.
+    """
+    values = np.asarray(values, dtype=float)
+    counts = np.asarray(counts, dtype=np.int64)
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan, np.nan
+    if rng is None:
+        rng = np.random.default_rng()
+
+    resamples = rng.multinomial(n, counts / n, size=n_boot)
+    means = resamples @ values / n
+    low, high = np.percentile(means, [(100 - ci) / 2, (100 + ci) / 2])
+    return low, high
+
+def bootstrap_ci(values, n_boot=1000, ci=95, rng=None):
+    """ This function returns the bootstrap percentile confidence interval of the mean of values, e.g. the thickness of
+    every measured line, see bootstrap_counts.
+    Returns (low, high), nan if there are no values.
+    """
+    values, counts = np.unique(np.asarray(values), return_counts=True)
+    return bootstrap_counts(values, counts, n_boot, ci, rng)
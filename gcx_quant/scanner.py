@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def _scan_dir(folder, ext):
+    """ This function returns the image files and the sub folders of one folder.
+    Hidden folders (e.g. the _detail folders of the manifests) are not returned.
+    """
+    files = []
+    subdirs = []
+    try:
+        entries = list(os.scandir(folder))
+    except OSError as e:
+        print(" - Cannot scan folder {}: {}".format(folder, e))
+        return files, subdirs
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir():
+            subdirs.append(entry.path)
+        elif entry.is_file() and entry.name.endswith(ext):
+            files.append(entry.name)
+    return sorted(files), subdirs
+
+def scan_tree(root, ext='czi', n_threads=8):
+    """ This function walks a tree of experiment folders and returns the image files of every folder.
+    Folders are scanned by a pool of threads, which hides the latency of network drives.
+    input root: top folder of the tree.
+    input ext: extension of the image files.
+    input n_threads: number of folders scanned at a time.
+    Returns a dictionary {folder: sorted file names}, only folders with image files, in sorted order.
+    """
+    found = {}
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        pending = {pool.submit(_scan_dir, root, ext): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                folder = pending.pop(future)
+                files, subdirs = future.result()
+                if files:
+                    found[folder] = files
+                for subdir in subdirs:
+                    pending[pool.submit(_scan_dir, subdir, ext)] = subdir
+    return dict(sorted(found.items()))
+
+def group_files(names, groups=('NC', 'CON', 'hr')):
+    """ This function groups the image files of one folder as the analyses do, by a string in the file name:
+    'NC' negative control, 'CON' control, 'hr' image samples.
+    input names: file names.
+    input groups: strings of the groups.
+    Returns a dictionary {group: file names containing the string}.
+    """
+    return {group: [name for name in names if group in name] for group in groups}
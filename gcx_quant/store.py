@@ -0,0 +1,146 @@
+import datetime
+import os
+import uuid
+from urllib.parse import quote
+
+from gcx_quant.files import folder_name
+from gcx_quant.profiling import stage
+
+# File extension of each format of the store, read and written with pyarrow.
+FORMATS = {"parquet": ".parquet", "feather": ".feather"}
+
+
+def _pyarrow():
+    """ This function returns pyarrow, needed only by the results store.
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("The results store needs pyarrow, install it with: pip install gcx_quant[store]") from None
+    return pyarrow
+
+def _check_format(fmt):
+    """ This function checks the file format of the store.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown store format {}, use {}.".format(fmt, " or ".join(repr(f) for f in FORMATS)))
+
+def new_run_id():
+    """ This function returns the id of a run, its start time followed by a random suffix, so ids sort by time.
+    """
+    return "{}-{}".format(datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f"), uuid.uuid4().hex[:8])
+
+def split_details(results):
+    """ This function splits the results of process functions called with detail=True into the result rows
+    and the rows of every detail table (e.g. per-line thickness, per-image histograms).
+    Results without detail are kept as they are.
+    input results: list of result dictionaries or of (result, {table: rows}).
+    Returns (results, details), details is a dictionary {table: rows of all images}.
+    """
+    rows = []
+    details = {}
+    for result in results:
+        # Results taken from a json manifest come back as lists.
+        if isinstance(result, (tuple, list)):
+            result, detail = result
+            for table, table_rows in detail.items():
+                details.setdefault(table, []).extend(table_rows)
+        rows.append(result)
+    return rows, details
+
+def append_rows(store_dir, analysis, table, rows, folder, run_id, fmt='parquet'):
+    """ This function appends rows to one table of the results store, as a new file of the partition of the experiment folder:
+    store_dir/analysis/table/experiment=FOLDER/part-RUN.parquet. Files are never overwritten, every run adds its own.
+    Each row gets the columns experiment (partition), folder, analysis and run_id.
+    input store_dir: folder of the store.
+    input analysis: name of the analysis, e.g. 'coverage'.
+    input table: name of the table, e.g. 'results', 'lines' or 'histograms'.
+    input rows: list of dictionaries with the same keys, lists of numbers are saved as list columns.
+    input folder: experiment folder of the images.
+    input run_id: id of the run, from new_run_id.
+    input fmt: 'parquet' or 'feather'.
+    Returns the file name, None if there are no rows.
+    """
+    _check_format(fmt)
+    if not rows:
+        return None
+    pa = _pyarrow()
+
+    with stage("write"):
+        folder = os.path.abspath(folder)
+        columns = {name: [row.get(name) for row in rows] for name in rows[0]}
+        columns.update(folder=[folder] * len(rows), analysis=[analysis] * len(rows), run_id=[run_id] * len(rows))
+        data = pa.table(columns)
+
+        # Partition values are url-encoded in the folder names, as pyarrow's hive partitioning reads them.
+        partition = os.path.join(store_dir, analysis, table, "experiment={}".format(quote(folder_name(folder), safe='')))
+        os.makedirs(partition, exist_ok=True)
+        file_name = os.path.join(partition, "part-{}{}".format(run_id, FORMATS[fmt]))
+
+        # Write to a temporary file first so an interrupted run never leaves a broken file in the store.
+        tmp_file = "{}.{}.tmp".format(file_name, os.getpid())
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(data, tmp_file)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(data, tmp_file)
+        os.replace(tmp_file, file_name)
+    return file_name
+
+def save_store(store_dir, analysis, folder, tables, fmt='parquet'):
+    """ This function appends the results of one run of an analysis on a folder to the results store, see append_rows.
+    All tables of the run get the same run id.
+    input store_dir: folder of the store.
+    input analysis: name of the analysis.
+    input folder: experiment folder of the images.
+    input tables: dictionary {table: rows}, e.g. {"results": results, "lines": line_rows}.
+    input fmt: 'parquet' or 'feather'.
+    Returns the run id.
+    """
+    run_id = new_run_id()
+    for table, rows in tables.items():
+        append_rows(store_dir, analysis, table, rows, folder, run_id, fmt)
+    print(" Results are added to the store {} (run {}).".format(store_dir, run_id))
+    return run_id
+
+def read_table(store_dir, analysis, table='results', experiments=None, latest=False, fmt='parquet'):
+    """ This function reads one table of the results store of all runs and experiments as one pyarrow table,
+    a columnar scan of the files, e.g. read_table('store', 'coverage').to_pandas() for statistics.
+    Columns added by later runs are filled with nulls in the files of earlier runs.
+    input store_dir: folder of the store.
+    input analysis: name of the analysis.
+    input table: name of the table.
+    input experiments: names of the experiment folders to read, None for all.
+    input latest: keep only the last run of each experiment folder.
+    input fmt: 'parquet' or 'feather', format of the files to read.
+    Returns a pyarrow.Table, with the column experiment of the partitions.
+    """
+    _check_format(fmt)
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    base = os.path.join(store_dir, analysis, table)
+    files = []
+    for root, _, names in os.walk(base):
+        files += [os.path.join(root, name) for name in sorted(names) if name.endswith(FORMATS[fmt])]
+    if not files:
+        raise FileNotFoundError("No {} files of table {} of {} in the store {}.".format(fmt, table, analysis, store_dir))
+
+    file_format = "parquet" if fmt == 'parquet' else "ipc"
+    partitioning = ds.partitioning(pa.schema([("experiment", pa.string())]), flavor="hive")
+    dataset = ds.dataset(files, format=file_format, partitioning=partitioning, partition_base_dir=base)
+    # Runs may have added columns or changed their types, e.g. integer to float.
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    schema = pa.unify_schemas(schemas + [dataset.partitioning.schema], promote_options="permissive")
+    dataset = ds.dataset(files, schema=schema, format=file_format, partitioning=partitioning, partition_base_dir=base)
+
+    data = dataset.to_table(filter=None if experiments is None else pc.field("experiment").isin(list(experiments)))
+    if latest and data.num_rows > 0:
+        # Run ids sort by start time, the last run of each experiment has the largest id.
+        last = data.group_by("experiment").aggregate([("run_id", "max")])
+        keep = set(zip(last["experiment"].to_pylist(), last["run_id_max"].to_pylist()))
+        mask = [pair in keep for pair in zip(data["experiment"].to_pylist(), data["run_id"].to_pylist())]
+        data = data.filter(pa.array(mask))
+    return data
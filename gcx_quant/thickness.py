@@ -0,0 +1,138 @@
+import numpy as np
+
+
+def profile_layers(profiles, level=1):
+    """ This function finds the layers of expression of intensity profiles along axis 0, e.g. the columns of an XZ view.
+    It is the vectorized form of intersecting each profile with the line intensity = level:
+    a profile crosses the line once per transition between pixels below and above level.
+    input profiles: array with the profiles along axis 0, any number of profiles in the other axes.
+    input level: intensity of the line the profiles are intersected with.
+    Returns (inters, thickb, thicka, thicks), arrays with one value per profile:
+    inters: number of intersections with the line.
+    thickb, thicka: number of non-zero pixels before and after the split point of profiles with 3 or 4 intersections.
+    thicks: number of non-zero pixels of the whole profile.
+    """
+    profiles = np.asarray(profiles)
+    n = profiles.shape[0]
+
+    # Intersections are the segments between two pixels on different sides of the line.
+    above = profiles > level
+    cross = above[1:] != above[:-1]
+    inters = np.count_nonzero(cross, axis=0)
+
+    # Segment index of the first, second and last intersection, equal to int(x) of the intersection points.
+    count = np.cumsum(cross, axis=0)
+    first = np.argmax(count >= 1, axis=0)
+    second = np.argmax(count >= 2, axis=0)
+    last = n - 2 - np.argmax(cross[::-1], axis=0)
+
+    # Split point between basal and apical layers.
+    # 3 intersections: after the first intersection if the profile starts in a layer, else before the last one.
+    # 4 intersections: after the second intersection.
+    splitpoint = np.where(profiles[0] > 0, first, last)
+    splitpoint = np.where(inters == 4, second, splitpoint)
+
+    # Non-zero pixels up to and including the split point are basal, the rest apical.
+    nonzero = np.cumsum(profiles != 0, axis=0)
+    thicks = nonzero[-1]
+    thickb = np.take_along_axis(nonzero, splitpoint[np.newaxis], axis=0)[0]
+    thicka = thicks - thickb
+    return inters, thickb, thicka, thicks
+
+def line_layers(im_clean, rand_index, noisy='stop'):
+    """ This function measures the layers along the lines rand_index of a thresholded XZ view, see line_thickness.
+    input im_clean: 2d thresholded image with z along axis 0.
+    input rand_index: column index of each line.
+    input noisy: 'stop', a line with more than 4 intersections is considered noisy and ends the measurement of the image,
+    as the lines were always measured; 'skip', noisy lines are left out and the other lines measured, like the columns
+    of layer_histograms.
+    Returns (lines, inters, thickb, thicka, thicks, n_noisy): arrays of profile_layers of the lines measured,
+    lines are their column indices, and the number of noisy lines among all lines.
+    """
+    if noisy not in ('stop', 'skip'):
+        raise ValueError("Unknown handling of noisy lines {}, use 'stop' or 'skip'.".format(noisy))
+    lines = np.asarray(rand_index)
+    inters, thickb, thicka, thicks = profile_layers(im_clean[:, lines])
+
+    is_noisy = inters > 4
+    n_noisy = int(np.count_nonzero(is_noisy))
+    if noisy == 'skip':
+        keep = ~is_noisy
+    else:
+        # Lines after the first noisy line are not measured.
+        keep = np.arange(lines.size) < (np.argmax(is_noisy) if n_noisy > 0 else lines.size)
+    return lines[keep], inters[keep], thickb[keep], thicka[keep], thicks[keep], n_noisy
+
+def layer_thickness(inters, thickb, thicka, thicks):
+    """ This function classifies measured profiles by their number of intersections with intensity = 1:
+    2 intersections are single layer, 3 or 4 intersections basal and apical layers, other profiles are left out.
+    input inters, thickb, thicka, thicks: arrays of profile_layers, or of line_layers.
+    Returns (bthick, athick, sthick, case): arrays of basal, apical and single layer thickness in pixels,
+    and the number of profiles with multi-layer expression.
+    """
+    multi = (inters == 3) | (inters == 4)
+    single = inters == 2
+    return thickb[multi], thicka[multi], thicks[single], int(np.count_nonzero(multi))
+
+def line_thickness(im_clean, rand_index, noisy='stop'):
+    """ This function measures the layer thickness along the lines rand_index of a thresholded XZ view in one pass.
+    It gives the same values as intersecting each line with intensity = 1 one at a time:
+    lines with 2 intersections are single layer, 3 or 4 intersections basal and apical layers,
+    lines with less than 2 intersections are skipped and a line with more than 4 intersections
+    is considered noisy and ends the measurement of the image, or is skipped with noisy='skip'.
+    input im_clean: 2d thresholded image with z along axis 0.
+    input rand_index: column index of each line.
+    input noisy: 'stop' or 'skip', see line_layers.
+    Returns (bthick, athick, sthick, case): arrays of basal, apical and single layer thickness in pixels,
+    and the number of lines with multi-layer expression.
+    """
+    _, inters, thickb, thicka, thicks, _ = line_layers(im_clean, rand_index, noisy)
+    return layer_thickness(inters, thickb, thicka, thicks)
+
+def layer_histograms(im_clean, level=1):
+    """ This function measures the layer thickness along every column of a thresholded XZ view.
+    Columns are classified like the random lines of line_thickness, but a noisy column (more than 4 intersections)
+    is only left out instead of ending the measurement.
+    Thickness values are returned as histograms (index = thickness in pixels, value = number of columns),
+    which can be added up over many planes and images in constant memory.
+    input im_clean: 2d thresholded image with z along axis 0.
+    input level: intensity of the line the columns are intersected with.
+    Returns (bhist, ahist, shist, noisy): histograms of basal, apical and single layer thickness,
+    and the number of noisy columns.
+    """
+    inters, thickb, thicka, thicks = profile_layers(im_clean, level)
+    length = im_clean.shape[0] + 1
+    bthick, athick, sthick, _ = layer_thickness(inters, thickb, thicka, thicks)
+    bhist = np.bincount(bthick, minlength=length)
+    ahist = np.bincount(athick, minlength=length)
+    shist = np.bincount(sthick, minlength=length)
+    return bhist, ahist, shist, int(np.count_nonzero(inters > 4))
+
+def hist_stats(hist, percentiles=(25, 50, 75)):
+    """ This function returns the mean, standard deviation and percentiles of values given by their histogram.
+    Percentiles are interpolated like np.percentile of the values themselves.
+    input hist: number of occurrences of each value, index = value.
+    input percentiles: percentiles to compute, in %.
+    Returns a dictionary {"n", "mean", "std", "p25", ...}, statistics are nan when hist is empty.
+    """
+    hist = np.asarray(hist)
+    n = int(hist.sum())
+    stats = {"n": n}
+    if n == 0:
+        stats.update({"mean": np.nan, "std": np.nan})
+        stats.update({"p{:g}".format(q): np.nan for q in percentiles})
+        return stats
+
+    values = np.arange(hist.size)
+    mean = np.sum(values * hist) / n
+    stats["mean"] = mean
+    stats["std"] = np.sqrt(np.sum((values - mean)**2 * hist) / n)
+
+    # Value at each sorted position is found from the cumulative histogram.
+    cum = np.cumsum(hist)
+    for q in percentiles:
+        pos = q / 100 * (n - 1)
+        lower = np.searchsorted(cum, np.floor(pos), side='right')
+        upper = np.searchsorted(cum, np.ceil(pos), side='right')
+        stats["p{:g}".format(q)] = lower + (upper - lower) * (pos - np.floor(pos))
+    return stats
@@ -0,0 +1,448 @@
+import os
+from functools import partial
+
+import numpy as np
+
+from gcx_quant.cache import cached_array
+from gcx_quant.files import folder_name, get_files, save_csv
+from gcx_quant.manifest import incremental_batch
+from gcx_quant.preprocess import blur, otsu, otsu_batch
+from gcx_quant.profiling import stage
+from gcx_quant.reader import read_czi_channel, read_czi_plane
+from gcx_quant.store import save_store, split_details
+from gcx_quant.sampling import bootstrap_counts, image_rng, sample_lines
+from gcx_quant.thickness import hist_stats, layer_histograms, layer_thickness, line_layers, profile_layers
+
+
+def cutout_blank(arr):
+    """ This function is used to cut out any blank areas in the first dimension of the image 
+    To avoid drawing lines in an empty space.
+    """
+    return arr [:, arr.sum(axis = 0) !=0]
+
+def clean_image(im, simga_gauss):
+    """ This function blurs and thresholds one XZ view and cuts out its blank space.
+    Returns the filtered image and its otsu threshold.
+    """
+    # Apply gaussian blur to the image and find otsu threshold, from one bincount of the blurred intensities.
+    with stage("blur"):
+        im_clean = blur(im, simga_gauss)
+    with stage("threshold"):
+        otsu_threshold = otsu(im_clean)
+
+        # Apply threshold to zero all pixels whose intensity value is less than the threshold.
+        im_clean = im_clean * (im_clean > otsu_threshold)
+
+        # Cut out blank space after filtering.
+        im_clean = cutout_blank(im_clean) 
+    return im_clean, otsu_threshold
+
+def clean_views(im, simga_gauss, batch=64):
+    """ This function yields the XZ views im[:, :, i] of a z-stack channel blurred and thresholded, batch at a time,
+    so only one batch of filtered views is in memory. Each view is filtered as clean_image does, without cutting out its blank space.
+    input im: channel of the z-stack (Z, X, Y).
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input batch: number of views filtered at once.
+    Yields (start, views, thresholds): index of the first view of the batch, filtered views (view, Z, X) and their otsu thresholds.
+    """
+    for start in range(0, im.shape[2], batch):
+        # Copy the views of the batch one after the other, then blur along Z and X only, each view on its own.
+        with stage("blur"):
+            views = np.ascontiguousarray(np.moveaxis(im[:, :, start:start + batch], 2, 0))
+            views = blur(views, simga_gauss, axes=(1, 2))
+        with stage("threshold"):
+            thresholds = otsu_batch(views, axis=0)
+            views *= views > thresholds[:, np.newaxis, np.newaxis]
+        yield start, views, thresholds
+
+def clean_planes(im, simga_gauss, batch=64):
+    """ This function yields clean_image of every XZ view im[:, :, i] of a z-stack channel.
+    Views are blurred and thresholded batch at a time, with the same results as clean_image of each view.
+    input im: channel of the z-stack (Z, X, Y).
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input batch: number of views blurred at once.
+    """
+    for _, views, thresholds in clean_views(im, simga_gauss, batch):
+        for plane, otsu_threshold in zip(views, thresholds):
+            with stage("threshold"):
+                plane = cutout_blank(plane)
+            yield plane, otsu_threshold
+
+def load_image(im_file, channel_index, all_planes=False, cache_dir=None):
+    """ This function returns the XZ view at the midpoint in the Y axis of one channel of a czi z-stack,
+    or the whole channel with all_planes.
+    input im_file: czi file of the z-stack image.
+    input channel_index: index of the channel to be extracted.
+    input all_planes: return the whole channel instead of the midpoint XZ view.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    """
+    if all_planes:
+        return cached_array(read_czi_channel, im_file, cache_dir, channel_index=channel_index)
+    # Only the subblocks of the channel crossing this plane are decoded, or the plane is read from the cache.
+    return cached_array(read_czi_plane, im_file, cache_dir, channel_index=channel_index, axis=2)
+
+def line_rows(file_name, lines, inters, thickb, thicka, thicks):
+    """ This function returns one row per layer of every measured line of an image, from line_layers.
+    """
+    rows = []
+    for line, n, b, a, t in zip(lines.tolist(), inters.tolist(), thickb.tolist(), thicka.tolist(), thicks.tolist()):
+        # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks.
+        if n in (3, 4):
+            rows.append({"file_name": file_name, "line": line, "layer": "Basal", "Thickness(µm)": (b - 1)*0.38})
+            rows.append({"file_name": file_name, "line": line, "layer": "Apical", "Thickness(µm)": (a - 1)*0.38})
+        elif n == 2:
+            rows.append({"file_name": file_name, "line": line, "layer": "Single", "Thickness(µm)": (t - 1)*0.38})
+    return rows
+
+def histogram_rows(file_name, bhist, ahist, shist):
+    """ This function returns one row per layer of an image with its thickness histogram, from layer_histograms.
+    """
+    rows = []
+    for layer, hist in (("Basal", bhist), ("Apical", ahist), ("Single", shist)):
+        thickness = np.flatnonzero(hist)
+        rows.append({"file_name": file_name, "layer": layer, "Thickness(µm)": ((thickness - 1)*0.38).tolist(),
+                     "counts": np.asarray(hist)[thickness].tolist()})
+    return rows
+
+def thickness_ci(result, layers, n_boot, ci, rng=None):
+    """ This function adds the bootstrap confidence interval of the average thickness of every layer to result,
+    as the columns "CI Low Basal Thickness(µm)", "CI High Basal Thickness(µm)", ...
+    input result: result of one image.
+    input layers: list of (layer, values, counts), the thickness values of a layer in pixels and their counts.
+    input n_boot: number of bootstrap resamples.
+    input ci: confidence level in %.
+    input rng: np.random.Generator, None for an unseeded generator.
+    """
+    with stage("bootstrap"):
+        for layer, values, counts in layers:
+            low, high = bootstrap_counts(values, counts, n_boot, ci, rng)
+            names = ["CI Low {} Thickness(µm)".format(layer), "CI High {} Thickness(µm)".format(layer)]
+            # If no thickness value is found, record values as zero.
+            if np.isnan(low):
+                result.update(dict.fromkeys(names, 0))
+                continue
+            # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks.
+            result.update(zip(names, [(low - 1)*0.38, (high - 1)*0.38])) #µm
+
+def process_image(im_file, channel_index, k, simga_gauss, cache_dir=None, im=None, detail=False, seed=None,
+                  sampling='random', noisy='stop', n_boot=0, ci=95):
+    """ This function returns the basal, apical and single layer thickness of one z-stack image from k random lines.
+    input im_file: czi file of the z-stack image.
+    input channel_index: index of the channel to be extracted.
+    input k: number of random lines.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input detail: also return the thickness of every layer of every line, as (result, {"lines": rows}).
+    input seed: seed of the lines and bootstrap resamples, each image draws from its own generator seeded by seed and
+    its file name. None draws the lines from numpy's global random state.
+    input sampling: 'random', 'unique' or 'stratified', how the lines are drawn, see sample_lines.
+    input noisy: 'stop' to end the measurement of the image at the first noisy line, 'skip' to only leave it out.
+    The number of measured and noisy lines is recorded either way.
+    input n_boot: number of bootstrap resamples of the confidence intervals of the average thickness, 0 for none.
+    input ci: confidence level of the intervals in %.
+    """
+    print(" - Processing image {} ...\n".format(im_file))
+
+    # Obtain orthogonal view of the Z-stack image. XZ view at the midpoint in the Y axis, im[:,:,im.shape[2]//2].
+    if im is None:
+        im = load_image(im_file, channel_index, cache_dir=cache_dir)
+
+    # plt.imsave('{}-{}.png'.format(im_file,"Before SA"), im, cmap='gray') # This line is used to print original image.
+
+    # Apply gaussian blur and otsu threshold, cut out blank space after filtering.
+    im_clean, otsu_threshold = clean_image(im, simga_gauss)
+
+    # plt.imsave('{}-{}.png'.format(im_file,"SA"), im_clean, cmap='gray') # This line is used to print image after filtering.
+
+    # Mimic drawing k number of random lines on the image to extract fluorescence thickness.
+    rng = None if seed is None else image_rng(seed, im_file)
+    rand_index = sample_lines(im_clean.shape[1], k, rng, sampling)
+
+    # Find intersections of the intensity profiles and intensity = 1 to find the layers of expression along all lines at once.
+    # Lines with more than two intersections are split into basal and apical layers, the count of these lines is the case of multi-layer expression.
+    with stage("measurement"):
+        layers = line_layers(im_clean, rand_index, noisy)
+        lines, n_noisy = layers[0], layers[5]
+        bthick, athick, sthick, case = layer_thickness(*layers[1:5])
+        if lines.size < rand_index.size:
+            print(" - {} of {} lines of image {} are not measured, {} noisy lines.\n".format(
+                rand_index.size - lines.size, rand_index.size, im_file, n_noisy), end="")
+
+    # If the list for thickness counting is empty, no thickness value is found. Record value as zero. 
+    lenb = len(bthick)
+    lena = len(athick)
+    lens = len(sthick)
+
+    if lenb == 0:
+        AVEbthick = 0
+    else:
+        # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks. 
+        AVEbthick = ((sum(bthick)/lenb)-1)*0.38 #µm
+        
+    if lena == 0:
+        AVEathick = 0
+    else:
+        # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks. 
+        AVEathick = ((sum(athick)/lena)-1)*0.38 #µm
+        
+    if lens == 0:
+        AVEsthick = 0
+    else:
+        # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks. 
+        AVEsthick = ((sum(sthick)/lens)-1)*0.38 #µm
+
+    # Percentage of cases that the expression shows apical and basal portions.
+    portion = case / rand_index.size * 100 
+
+    # Dictionary, link index with a string...
+    result = {"file_name" : os.path.basename(im_file),
+              "Average Basal Thickness(µm)" : AVEbthick,
+              "Average Apical Thickness(µm)" : AVEathick,
+              "Average Single Thickness(µm)" : AVEsthick,
+              "Chances of Bilayer Expression(%)" : portion,
+              "Threshold": otsu_threshold,
+              "Gaussian": simga_gauss,
+              "Lines": lines.size,
+              "Noisy Lines": n_noisy}
+    if n_boot > 0:
+        thickness_ci(result, [(layer, *np.unique(values, return_counts=True))
+                              for layer, values in (("Basal", bthick), ("Apical", athick), ("Single", sthick))],
+                     n_boot, ci, rng)
+    if detail:
+        return result, {"lines": line_rows(result["file_name"], *layers[:5])}
+    return result
+
+def process_image_full(im_file, channel_index, simga_gauss, all_planes, cache_dir=None, im=None, detail=False, seed=None,
+                       n_boot=0, ci=95):
+    """ This function returns the distribution of basal, apical and single layer thickness of one z-stack image
+    measured along every column of the XZ view instead of random lines.
+    input im_file: czi file of the z-stack image.
+    input channel_index: index of the channel to be extracted.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input all_planes: measure the XZ views at every Y plane of the stack instead of the midpoint only.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input detail: also return the thickness histograms of the image, as (result, {"histograms": rows}).
+    input seed: seed of the bootstrap resamples, see image_rng. None for unseeded resamples.
+    input n_boot: number of bootstrap resamples of the confidence intervals of the average thickness, 0 for none.
+    input ci: confidence level of the intervals in %.
+    """
+    print(" - Processing image {} ...\n".format(im_file))
+
+    if im is None:
+        im = load_image(im_file, channel_index, all_planes, cache_dir)
+    if all_planes:
+        # Decode the channel once and go through the XZ views one Y plane at a time, filtered batch at a time.
+        planes = clean_planes(im, simga_gauss)
+    else:
+        planes = [clean_image(im, simga_gauss)]
+
+    # Thickness of every column is collected in histograms, so memory does not grow with the number of planes.
+    bhist = ahist = shist = 0
+    lines = 0
+    noisy = 0
+    thresholds = []
+    for im_clean, otsu_threshold in planes:
+        with stage("measurement"):
+            b, a, s, n = layer_histograms(im_clean)
+        bhist = bhist + b
+        ahist = ahist + a
+        shist = shist + s
+        noisy += n
+        lines += im_clean.shape[1]
+        thresholds.append(otsu_threshold)
+    result = thickness_result(os.path.basename(im_file), bhist, ahist, shist, lines, noisy, thresholds, simga_gauss,
+                              n_boot, ci, None if seed is None else image_rng(seed, im_file))
+    if detail:
+        return result, {"histograms": histogram_rows(result["file_name"], bhist, ahist, shist)}
+    return result
+
+def thickness_result(file_name, bhist, ahist, shist, lines, noisy, thresholds, simga_gauss, n_boot=0, ci=95, rng=None):
+    """ This function returns the result of one image measured along every column from its thickness histograms.
+    input file_name: name of the image file.
+    input bhist, ahist, shist: histograms of basal, apical and single layer thickness in pixels, from layer_histograms.
+    input lines: number of columns with expression.
+    input noisy: number of noisy columns.
+    input thresholds: otsu thresholds of the measured XZ views.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input n_boot: number of bootstrap resamples of the confidence intervals of the average thickness, 0 for none.
+    input ci: confidence level of the intervals in %.
+    input rng: np.random.Generator of the resamples, None for an unseeded generator.
+    """
+    result = {"file_name" : file_name}
+    for layer, hist in (("Basal", bhist), ("Apical", ahist), ("Single", shist)):
+        stats = hist_stats(hist)
+        names = ["{} {} Thickness(µm)".format(stat, layer) for stat in ("Average", "Std", "P25", "Median", "P75")]
+        # If no thickness value is found, record values as zero.
+        if stats["n"] == 0:
+            result.update(dict.fromkeys(names, 0))
+            continue
+        # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks. 
+        values = [(stats["mean"]-1)*0.38, stats["std"]*0.38, (stats["p25"]-1)*0.38, (stats["p50"]-1)*0.38, (stats["p75"]-1)*0.38] #µm
+        result.update(zip(names, values))
+
+    # Percentage of lines that the expression shows apical and basal portions.
+    # If no column has expression (empty or blank stack), record the value as zero like the thickness values.
+    result["Chances of Bilayer Expression(%)"] = np.sum(bhist) / lines * 100 if lines > 0 else 0
+    result["Lines"] = lines
+    result["Noisy Lines"] = noisy
+    result["Threshold"] = np.mean(thresholds)
+    result["Gaussian"] = simga_gauss
+    if n_boot > 0:
+        thickness_ci(result, [(layer, np.arange(np.size(hist)), hist)
+                              for layer, hist in (("Basal", bhist), ("Apical", ahist), ("Single", shist))],
+                     n_boot, ci, rng)
+    return result
+
+# Maps saved by process_image_maps, in this order.
+MAP_NAMES = ["Layers", "Thickness(µm)", "Basal Thickness(µm)", "Apical Thickness(µm)"]
+
+def save_maps(maps, out_dir, file_name, map_format='npy'):
+    """ This function saves the thickness maps of one image as {file_name}_Thickness_Map.npy or .tif.
+    input maps: float32 array (map, X, Y), maps in the order of MAP_NAMES.
+    input out_dir: folder of the maps.
+    input file_name: name of the image file.
+    input map_format: 'npy' or 'tif' (one page per map).
+    """
+    map_file = os.path.join(out_dir, "{}_Thickness_Map.{}".format(file_name.split('.')[0], map_format))
+    with stage("write"):
+        if map_format == 'npy':
+            np.save(map_file, maps)
+        elif map_format == 'tif':
+            import tifffile
+            tifffile.imwrite(map_file, maps, metadata={'axes': 'CYX', 'Labels': MAP_NAMES})
+        else:
+            raise ValueError("Unknown map format {}, use 'npy' or 'tif'.".format(map_format))
+
+def process_image_maps(im_file, channel_index, simga_gauss, out_dir='.', map_format='npy', cache_dir=None, im=None,
+                       detail=False, seed=None, n_boot=0, ci=95):
+    """ This function measures the layers along Z at every (x, y) position of one z-stack image,
+    saves the layer count and thickness maps, and returns the thickness distribution of all positions.
+    The XZ views are filtered as with full_width and all_planes, so the returned result is the same,
+    with the percentage of positions with expression and their average number of layers.
+    input im_file: czi file of the z-stack image.
+    input channel_index: index of the channel to be extracted.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input out_dir: folder of the maps.
+    input map_format: 'npy' or 'tif', file format of the maps.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image with all_planes, None to read it here.
+    input detail: also return the thickness histograms of the image, as (result, {"histograms": rows}).
+    input seed, n_boot, ci: bootstrap confidence intervals of the average thickness, see process_image_full.
+    """
+    print(" - Processing image {} ...\n".format(im_file))
+
+    if im is None:
+        im = load_image(im_file, channel_index, True, cache_dir)
+
+    maps = np.zeros((len(MAP_NAMES),) + im.shape[1:], np.float32)
+    length = im.shape[0] + 1
+    bhist = ahist = shist = 0
+    lines = 0
+    noisy = 0
+    thresholds = []
+    # Views are filtered and measured batch of Y planes at a time, memory does not grow with the number of planes.
+    for start, views, batch_thresholds in clean_views(im, simga_gauss):
+        with stage("measurement"):
+            # Layers along Z of every (view, x) position at once.
+            inters, thickb, thicka, thicks = profile_layers(np.moveaxis(views, 1, 0))
+            multi = (inters == 3) | (inters == 4)
+            single = inters == 2
+            bhist = bhist + np.bincount(thickb[multi], minlength=length)
+            ahist = ahist + np.bincount(thicka[multi], minlength=length)
+            shist = shist + np.bincount(thicks[single], minlength=length)
+            noisy += int(np.count_nonzero(inters > 4))
+            # Positions with expression are the columns clean_image keeps.
+            lines += int(np.count_nonzero(thicks))
+
+            # A profile crosses intensity = 1 twice per layer, once less for a layer starting at the bottom of the stack.
+            layers = np.where(views[:, 0, :] > 1, inters // 2 + 1, (inters + 1) // 2)
+            stop = start + views.shape[0]
+            maps[0, :, start:stop] = layers.T
+            # Convert the count of non-zero value to thickness value by multiplying the length of the interval between z-stacks.
+            maps[1, :, start:stop] = (np.where(thicks > 0, thicks - 1, 0) * 0.38).T
+            maps[2, :, start:stop] = (np.where(multi, thickb - 1, 0) * 0.38).T
+            maps[3, :, start:stop] = (np.where(multi, thicka - 1, 0) * 0.38).T
+        thresholds.extend(batch_thresholds)
+
+    file_name = os.path.basename(im_file)
+    save_maps(maps, out_dir, file_name, map_format)
+
+    result = thickness_result(file_name, bhist, ahist, shist, lines, noisy, thresholds, simga_gauss,
+                              n_boot, ci, None if seed is None else image_rng(seed, im_file))
+    result["Coverage(%)"] = lines / maps[0].size * 100
+    result["Average Layers"] = np.sum(maps[0]) / lines if lines > 0 else 0
+    if detail:
+        return result, {"histograms": histogram_rows(file_name, bhist, ahist, shist)}
+    return result
+
+def run(folder='.', channel_index=0, k=100, simga_gauss=1, full_width=False, all_planes=False,
+        out_dir=None, n_workers=None, cache_dir=None, manifest_file=None, timings=None, maps=False, map_format='npy',
+        store_dir=None, store_format='parquet', seed=None, sampling='random', noisy='stop', n_boot=0, ci=95):
+    """ This function saves the basal, apical and single layer thickness of every czi z-stack image of folder.
+    input folder: folder of the czi files.
+    input channel_index: index of the channel to be extracted.
+    input k: number of random lines.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input full_width: measure every column of the XZ view instead of k random lines.
+    input all_planes: with full_width, measure the XZ views at every Y plane of the stack instead of the midpoint only.
+    input out_dir: folder of the results, None for folder.
+    input n_workers: number of worker processes, None uses all cores.
+    input cache_dir: folder of the cached decoded arrays, None to decode every file.
+    input manifest_file: json manifest of the processed images, only new or changed images are processed, None to process all.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    input maps: measure every (x, y) position of the stack and save the layer count and thickness maps of every image,
+    the results are those of full_width and all_planes.
+    input map_format: 'npy' or 'tif', file format of the maps.
+    input store_dir: folder of the columnar results store the results are also appended to, with the thickness of every
+    line (random lines) or the thickness histograms of every image (full_width, maps). None to only save the csv.
+    input store_format: 'parquet' or 'feather', file format of the store.
+    input seed: seed of the random lines and bootstrap resamples, every image gets its own generator from seed and its
+    file name, so results do not depend on the number of workers or the order of the files. None for unseeded runs.
+    input sampling: 'random', 'unique' or 'stratified', how the random lines are drawn, see sample_lines.
+    input noisy: 'stop' or 'skip', whether a noisy random line ends the measurement of the image or is only left out.
+    input n_boot: number of bootstrap resamples of the confidence intervals of the average thickness, 0 for none.
+    input ci: confidence level of the intervals in %.
+    Returns (results, failed) of run_batch.
+    """
+    out_dir = folder if out_dir is None else out_dir
+    im_files = get_files(folder)
+
+    # Open image files under the file path, one image per worker process.
+    load = partial(load_image, channel_index=channel_index, all_planes=maps or (full_width and all_planes),
+                   cache_dir=cache_dir)
+    if maps:
+        results, failed = incremental_batch(process_image_maps, im_files, manifest_file, n_workers=n_workers, load=load,
+                                            timings=timings, channel_index=channel_index, simga_gauss=simga_gauss,
+                                            out_dir=out_dir, map_format=map_format, cache_dir=cache_dir,
+                                            detail=store_dir is not None, seed=seed, n_boot=n_boot, ci=ci)
+    elif full_width:
+        results, failed = incremental_batch(process_image_full, im_files, manifest_file, n_workers=n_workers, load=load,
+                                            timings=timings, channel_index=channel_index, simga_gauss=simga_gauss,
+                                            all_planes=all_planes, cache_dir=cache_dir, detail=store_dir is not None,
+                                            seed=seed, n_boot=n_boot, ci=ci)
+    else:
+        results, failed = incremental_batch(process_image, im_files, manifest_file, n_workers=n_workers, load=load,
+                                            timings=timings, channel_index=channel_index, k=k, simga_gauss=simga_gauss,
+                                            cache_dir=cache_dir, detail=store_dir is not None, seed=seed,
+                                            sampling=sampling, noisy=noisy, n_boot=n_boot, ci=ci)
+    results, details = split_details(results)
+    print(" Finished.")
+
+    csv_file = os.path.join(out_dir, "{}_Con_Results.csv".format(folder_name(folder)[:3]))
+    csv_columns = ['file_name', 'Average Basal Thickness(µm)', 'Average Apical Thickness(µm)', 'Average Single Thickness(µm)', 'Chances of Bilayer Expression(%)', 'Threshold', 'Gaussian']
+    if full_width or maps:
+        csv_columns += ['{} {} Thickness(µm)'.format(stat, layer) for layer in ('Basal', 'Apical', 'Single') for stat in ('Std', 'P25', 'Median', 'P75')]
+    csv_columns += ['Lines', 'Noisy Lines']
+    if maps:
+        csv_columns += ['Coverage(%)', 'Average Layers']
+    if n_boot > 0:
+        csv_columns += ['CI {} {} Thickness(µm)'.format(bound, layer) for layer in ('Basal', 'Apical', 'Single') for bound in ('Low', 'High')]
+
+    print("-"*20)
+    save_csv(csv_file, csv_columns, results)
+    if store_dir is not None:
+        save_store(store_dir, "thickness_xz", folder, dict(results=results, **details), store_format)
+    print("-"*20)
+    return results, failed
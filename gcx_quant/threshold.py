@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def find_crossings(xs, y0, y1):
+    """ This function returns the intersection points of two curves sampled at the same xs, e.g. two histograms.
+    Points are found from the sign changes of y1 - y0 with linear interpolation between samples,
+    as intersecting the two curves as LineStrings would, and are sorted by x.
+    input xs: increasing x values of the samples.
+    input y0, y1: y values of the two curves.
+    Returns (x, y) arrays of the intersection points.
+    """
+    xs = np.asarray(xs, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    d = np.asarray(y1, dtype=float) - y0
+
+    # Samples where the curves meet.
+    touch = np.flatnonzero(d == 0)
+
+    # Segments where the curves cross between two samples.
+    i = np.flatnonzero(d[:-1] * d[1:] < 0)
+    t = d[i] / (d[i] - d[i+1])
+    x = xs[i] + t * (xs[i+1] - xs[i])
+    y = y0[i] + t * (y0[i+1] - y0[i])
+
+    x = np.concatenate((x, xs[touch]))
+    y = np.concatenate((y, y0[touch]))
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+def find_threshold(xs, y0, y1, select='first'):
+    """ This function finds the threshold as the intersection of the negative control and control histograms.
+    input xs: intensity at the center of each bin.
+    input y0: histogram of the negative control.
+    input y1: histogram of the control (or image sample).
+    input select: which intersection is the threshold, in order of intensity.
+    'first': first intersection whose intensity and frequency are not zero, or the only intersection.
+    'last': last intersection whose frequency is not zero.
+    Returns (threshold, frequency) of the selected intersection.
+    """
+    x, y = find_crossings(xs, y0, y1)
+    if x.size == 0:
+        raise ValueError("The histograms of the negative control and the control do not intersect.")
+
+    if select == 'first':
+        if x.size == 1:
+            return x[0], y[0]
+        found = np.flatnonzero((x > 0) & (y > 0))
+        if found.size > 0:
+            return x[found[0]], y[found[0]]
+    elif select == 'last':
+        found = np.flatnonzero(y > 0)
+        if found.size > 0:
+            return x[found[-1]], y[found[-1]]
+    else:
+        raise ValueError("Unknown selection {}, use 'first' or 'last'.".format(select))
+    raise ValueError("No intersection of the histograms has a frequency above zero.")
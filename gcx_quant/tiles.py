@@ -0,0 +1,31 @@
+from gcx_quant.histogram import intensity_counts, merge_counts
+from gcx_quant.intensity import intensity_stats_tiles
+from gcx_quant.reader import iter_czi_tiles, project_czi_tiles
+
+
+def projection_counts(czi_file, channel_index=0, projection='max', tile=4096):
+    """ This function returns the intensity counts of the z-projection of one channel of a czi image, e.g. a large mosaic scan,
+    counted region by region so the projection is never held in memory as a whole.
+    Counts of the regions add up to the same result as intensity_counts(project_czi(czi_file, channel_index, projection)),
+    and the threshold, coverage and histograms of the analyses follow exactly from the counts.
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input projection: z-projection method, 'max', 'sum' or 'mean'.
+    input tile: size in pixels of the square regions.
+    Returns (values, counts) as intensity_counts.
+    """
+    counts = None
+    for _, proj in project_czi_tiles(czi_file, channel_index, projection, tile):
+        region_counts = intensity_counts(proj)
+        counts = region_counts if counts is None else merge_counts(counts, region_counts)
+    return counts
+
+def channel_stats(czi_file, channel_index=0, tile=4096):
+    """ This function returns the mean, median and integrated density of one channel of a czi image and of each of its
+    z-slices, measured region by region of the mosaic, see intensity_stats_tiles.
+    input czi_file: czi file name.
+    input channel_index: index of the channel to be extracted.
+    input tile: size in pixels of the square regions.
+    Returns (stack, per_slice) statistics of the whole channel and of each slice.
+    """
+    return intensity_stats_tiles((index, plane) for _, index, plane in iter_czi_tiles(czi_file, channel_index, tile))
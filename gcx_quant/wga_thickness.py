@@ -0,0 +1,238 @@
+import os
+from functools import partial
+
+import numpy as np
+
+from gcx_quant.cache import cached_array
+from gcx_quant.batch import run_stacked
+from gcx_quant.files import folder_name, get_files, save_csv
+from gcx_quant.manifest import incremental_batch
+from gcx_quant.plots import defer_plot, render_plots
+from gcx_quant.preprocess import blur, otsu, otsu_batch
+from gcx_quant.profiling import stage
+from gcx_quant.reader import read_czi_channel
+from gcx_quant.sampling import bootstrap_ci, image_rng, sample_lines
+from gcx_quant.store import save_store, split_details
+
+
+def cutout_blank(arr):
+    return arr [:, arr.sum(axis = 0) !=0]
+
+def load_image(czi_file, channel_index, cache_dir=None):
+    """ This function returns one channel of a czi image.
+    input czi_file: czi file of the image.
+    input channel_index: index of the channel to be extracted.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    """
+    # Decode only the defined channel to im, or read it from the cache.
+    return cached_array(read_czi_channel, czi_file, cache_dir, channel_index=channel_index)
+
+def load_view(czi_file, channel_index, cache_dir=None):
+    """ This function returns one channel of a czi orthogonal view flipped to x-z, as process_image flips it,
+    so views of the same size are stacked in the same orientation.
+    """
+    im = load_image(czi_file, channel_index, cache_dir)
+    row, col = im.shape
+    if row > col:
+        im = np.transpose(im)
+    return im
+
+def process_image(czi_file, channel_index, k, simga_gauss, full_width=False, out_dir='.', cache_dir=None, im=None,
+                  plots=True, detail=False, seed=None, sampling='random', n_boot=0, ci=95):
+    """ This function returns the thickness of one orthogonal view image from k random lines.
+    input czi_file: czi file of the orthogonal view.
+    input channel_index: index of the channel to be extracted.
+    input k: number of random lines.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input full_width: measure every column instead of k random lines, and add the quartiles of thickness.
+    input out_dir: folder of the filtered image.
+    input cache_dir: folder of the cached decoded arrays, None to decode the file.
+    input im: image already read by load_image, None to read it here.
+    input plots: store the filtered image, saved as png after the analysis by render_plots.
+    input detail: also return the thickness of every line, as (result, {"lines": rows}).
+    input seed: seed of the lines and bootstrap resamples, each image draws from its own generator seeded by seed and
+    its file name. None draws the lines from numpy's global random state.
+    input sampling: 'random', 'unique' or 'stratified', how the lines are drawn, see sample_lines.
+    input n_boot: number of bootstrap resamples of the confidence interval of the mean thickness, 0 for none.
+    input ci: confidence level of the interval in %.
+    """
+    print(" - Processing image {} ...\n".format(czi_file), end="")
+
+    if im is None:
+        im = load_image(czi_file, channel_index, cache_dir)
+
+    # Flip all orthogonal view images to x-z.
+    row, col = im.shape
+    if row > col:
+        im = np.transpose(im)
+
+    # Apply gaussian blur to image, otsu threshold from one bincount of the blurred intensities.
+    with stage("blur"):
+        im_clean = blur(im, simga_gauss)
+    with stage("threshold"):
+        otsu_threshold = otsu(im_clean)
+        im_clean = im_clean * (im_clean > otsu_threshold)
+
+    # Cut out blank space after filtering.
+    # im_clean = cutout_blank(im_clean) 
+
+    # Mimic drawing k number of random lines on the image to extract fluorescence thickness.
+    rng = None if seed is None else image_rng(seed, czi_file)
+    if full_width:
+        rand_index = np.arange(im_clean.shape[1])
+    else:
+        rand_index = sample_lines(im_clean.shape[1], k, rng, sampling)
+
+    # Use the following script if want to save modified image with random lines shown.
+    im_plot = im_clean.copy()
+    #im_plot[:, rand_index] = np.max(im_plot) + 500
+    #im_clean[:, rand_index] = np.max(im_clean) 
+    file_name = os.path.basename(czi_file)
+    if plots:
+        defer_plot("image", os.path.join(out_dir, '{}-{}.png'.format(file_name.split('.')[0], simga_gauss)), im=im_plot)
+
+    # Average thickness in microns.
+    with stage("measurement"):
+        rand_thick = np.count_nonzero(im_clean[:, rand_index], axis=0) * 9.17 / 130 
+        thick_mean = np.average(rand_thick)
+        thick_std = np.std(rand_thick)
+
+    # Dictionary, link index with a string...
+    result = {"file_name" : file_name, "mean" : thick_mean, "std" : thick_std, "otsu" : otsu_threshold, "gaussian": simga_gauss}
+    if full_width:
+        result["p25"], result["median"], result["p75"] = np.percentile(rand_thick, [25, 50, 75])
+    if n_boot > 0:
+        with stage("bootstrap"):
+            result["mean_ci_low"], result["mean_ci_high"] = bootstrap_ci(rand_thick, n_boot, ci, rng)
+    if detail:
+        return result, {"lines": [{"file_name": file_name, "line": line, "thickness": thick}
+                                  for line, thick in zip(rand_index.tolist(), rand_thick.tolist())]}
+    return result
+
+def process_stack(czi_files, channel_index, k, simga_gauss, full_width=False, out_dir='.', cache_dir=None, ims=None,
+                  plots=True, detail=False, seed=None, sampling='random', n_boot=0, ci=95):
+    """ This function returns the thickness of a stack of orthogonal view images of the same size, with the same results
+    as process_image of every image. Images are blurred together along their own axes only, their otsu thresholds
+    found from one 2d histogram and the thickness of the lines of all images counted at once, so small images
+    are processed in a few numpy calls.
+    input czi_files: czi files of the orthogonal views.
+    input ims: images already read by load_view, all of the same shape, None to read them here.
+    Other inputs as process_image.
+    Returns the list of results of the images, in the order of czi_files.
+    """
+    for czi_file in czi_files:
+        print(" - Processing image {} ...\n".format(czi_file), end="")
+
+    if ims is None:
+        ims = [load_view(czi_file, channel_index, cache_dir) for czi_file in czi_files]
+    stack = np.stack(ims)
+
+    # Apply gaussian blur along the axes of each image, otsu threshold of every image from one histogram per row.
+    with stage("blur"):
+        stack = blur(stack, simga_gauss, axes=(1, 2))
+    with stage("threshold"):
+        thresholds = otsu_batch(stack, axis=0)
+        stack *= stack > thresholds[:, np.newaxis, np.newaxis]
+
+    # Mimic drawing k number of random lines on every image, each image with its own generator.
+    n, _, width = stack.shape
+    rngs = [None if seed is None else image_rng(seed, czi_file) for czi_file in czi_files]
+    if full_width:
+        rand_index = np.broadcast_to(np.arange(width), (n, width))
+    else:
+        rand_index = np.stack([sample_lines(width, k, rng, sampling) for rng in rngs])
+
+    # Thickness in microns of the lines of all images, from the non-zero pixels of every column.
+    with stage("measurement"):
+        rand_thick = np.take_along_axis(np.count_nonzero(stack, axis=1), rand_index, axis=1) * 9.17 / 130
+        thick_mean = np.mean(rand_thick, axis=1)
+        thick_std = np.std(rand_thick, axis=1)
+        if full_width:
+            quartiles = np.percentile(rand_thick, [25, 50, 75], axis=1).T
+
+    results = []
+    for i, czi_file in enumerate(czi_files):
+        file_name = os.path.basename(czi_file)
+        if plots:
+            defer_plot("image", os.path.join(out_dir, '{}-{}.png'.format(file_name.split('.')[0], simga_gauss)), im=stack[i])
+        result = {"file_name" : file_name, "mean" : thick_mean[i], "std" : thick_std[i], "otsu" : thresholds[i],
+                  "gaussian": simga_gauss}
+        if full_width:
+            result["p25"], result["median"], result["p75"] = quartiles[i]
+        if n_boot > 0:
+            with stage("bootstrap"):
+                result["mean_ci_low"], result["mean_ci_high"] = bootstrap_ci(rand_thick[i], n_boot, ci, rngs[i])
+        if detail:
+            result = result, {"lines": [{"file_name": file_name, "line": line, "thickness": thick}
+                                        for line, thick in zip(rand_index[i].tolist(), rand_thick[i].tolist())]}
+        results.append(result)
+    return results
+
+def run(folder='.', channel_index=0, k=50, simga_gauss=1, full_width=False, out_dir=None, n_workers=None, cache_dir=None,
+        manifest_file=None, timings=None, plots=True, store_dir=None, store_format='parquet', seed=None, sampling='random',
+        n_boot=0, ci=95, batch=None):
+    """ This function saves the thickness of every czi orthogonal view image of folder.
+    input folder: folder of the czi files.
+    input channel_index: index of the channel to be extracted.
+    input k: number of random lines.
+    input simga_gauss: standard deviation for Gaussian kernel.
+    input full_width: measure every column instead of k random lines.
+    input out_dir: folder of the results and filtered images, None for folder.
+    input n_workers: number of worker processes, None uses all cores.
+    input cache_dir: folder of the cached decoded arrays, None to decode every file.
+    input manifest_file: json manifest of the processed images, only new or changed images are processed, None to process all.
+    input timings: list to which the time of the stages of every processed image is appended, None to not profile.
+    input plots: save the filtered images, rendered in worker processes after the thickness is saved.
+    input store_dir: folder of the columnar results store the results and the thickness of every line are also appended to,
+    None to only save the csv.
+    input store_format: 'parquet' or 'feather', file format of the store.
+    input seed: seed of the random lines and bootstrap resamples, every image gets its own generator from seed and its
+    file name, so results do not depend on the number of workers or the order of the files. None for unseeded runs.
+    input sampling: 'random', 'unique' or 'stratified', how the random lines are drawn, see sample_lines.
+    input n_boot: number of bootstrap resamples of the confidence interval of the mean thickness, 0 for none.
+    input ci: confidence level of the interval in %.
+    input batch: stack up to batch images of the same size and process them together with process_stack, faster for
+    folders of many small images. None processes one image at a time.
+    Returns (results, failed) of run_batch.
+    """
+    out_dir = folder if out_dir is None else out_dir
+    czi_files = get_files(folder)
+
+    print('-'*20)
+    print(" Params used:\n")
+    print(" - Number of random lines used: {}".format("all columns" if full_width else k))
+    print(" - Gaussian blur: {}".format(simga_gauss))
+    print(" - Channel of czi image: {}\n".format(channel_index))
+    print('-'*20)
+    print(" Image processing in progress ...\n")
+
+    # Run through all czi files in the folder, one image per worker process.
+    params = dict(channel_index=channel_index, k=k, simga_gauss=simga_gauss, full_width=full_width, out_dir=out_dir,
+                  cache_dir=cache_dir, plots=plots, detail=store_dir is not None, seed=seed, sampling=sampling,
+                  n_boot=n_boot, ci=ci)
+    if batch:
+        # Images are read in background threads and stacked by size, stacks are processed in the worker processes.
+        load = partial(load_view, channel_index=channel_index, cache_dir=cache_dir)
+        results, failed = incremental_batch(process_stack, czi_files, manifest_file, n_workers=n_workers, load=load,
+                                            timings=timings, runner=partial(run_stacked, batch=batch), **params)
+    else:
+        load = partial(load_image, channel_index=channel_index, cache_dir=cache_dir)
+        results, failed = incremental_batch(process_image, czi_files, manifest_file, n_workers=n_workers, load=load,
+                                            timings=timings, **params)
+    results, details = split_details(results)
+    print(" Finished.")
+
+    print('-'*20)
+    csv_file = os.path.join(out_dir, "{}_Con_Results.csv".format(folder_name(folder)[:3]))
+    csv_columns = ['file_name', 'mean', 'std', 'otsu','gaussian']
+    if full_width:
+        csv_columns += ['p25', 'median', 'p75']
+    if n_boot > 0:
+        csv_columns += ['mean_ci_low', 'mean_ci_high']
+    save_csv(csv_file, csv_columns, results)
+    if store_dir is not None:
+        save_store(store_dir, "wga_thickness", folder, dict(results=results, **details), store_format)
+    # Filtered images are saved from the stored arrays once the results are saved.
+    if plots:
+        render_plots(out_dir, n_workers)
+    return results, failed